@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+   audio_analysis.py — BPM e proxy danceability/energia da file audio locali (offline)
+
+   Uso:  python audio_analysis.py <cartella> [--out output/audio_features.json] [--workers N]
+   Il file prodotto è un dump leggibile dal backend "dump" di features.py (chiave = nome file senza estensione).
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import struct
+import subprocess
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from config import AUDIO_DIR
+
+AUDIO_CACHE_PATH = Path("output/audio_cache.sqlite")
+AUDIO_EXT = {".wav", ".mp3", ".flac", ".ogg", ".m4a", ".aac"}
+ANALYSIS_VERSION = 2       # nella chiave della cache: da incrementare se cambia l'analisi (2: ottava del tempo)
+
+# Analisi
+TARGET_SR = 11025          # il ritmo non richiede banda piena
+N_FFT, HOP = 512, 256      # ~46 ms / ~23 ms a 11 kHz
+BPM_MIN, BPM_MAX = 60.0, 200.0
+BPM_PRIOR, BPM_PRIOR_OCT = 120.0, 1.0   # prior log-gaussiano sul tempo (in ottave)
+OCTAVE_RATIO = 0.85        # tempo doppio preferito se il suo punteggio è almeno l'85% di quello scelto
+
+# ----------------------------------------------------------------------------------------
+# Decodifica: WAV PCM letto via memmap direttamente dal file; gli altri formati sono
+# decodificati con ffmpeg (se presente) in un PCM grezzo temporaneo, poi memmap.
+
+_WAV_DTYPE = {(1, 1): "u1", (1, 2): "<i2", (1, 4): "<i4", (3, 4): "<f4", (3, 8): "<f8"}
+
+def _wav_layout(path):
+    with open(path, "rb") as f:
+        riff, _, wave = struct.unpack("<4sI4s", f.read(12))
+        if riff != b"RIFF" or wave != b"WAVE":
+            raise ValueError("non è un file WAV RIFF")
+        fmt = None
+        while True:
+            head = f.read(8)
+            if len(head) < 8:
+                raise ValueError("chunk 'data' assente")
+            cid, size = struct.unpack("<4sI", head)
+            if cid == b"fmt ":
+                tag, ch, sr, _, _, bits = struct.unpack("<HHIIHH", f.read(16))
+                if tag == 0xFFFE:  # WAVE_FORMAT_EXTENSIBLE: il sottoformato è nei primi 2 byte del GUID
+                    f.seek(8, 1); tag = struct.unpack("<H", f.read(2))[0]; f.seek(size - 26, 1)
+                else:
+                    f.seek(size - 16, 1)
+                fmt = (tag, ch, sr, bits // 8)
+            elif cid == b"data":
+                if fmt is None:
+                    raise ValueError("chunk 'fmt ' assente")
+                tag, ch, sr, width = fmt
+                dtype = _WAV_DTYPE.get((tag, width))
+                if dtype is None:
+                    raise ValueError(f"formato WAV non supportato (tag={tag}, {8*width} bit)")
+                return f.tell(), size // (ch * width), ch, sr, dtype
+            else:
+                f.seek(size + (size & 1), 1)
+
+def _to_float(x, dtype):
+    if dtype == "u1":
+        return (x.astype(np.float32) - 128.0) / 128.0
+    if dtype in ("<i2", "<i4"):
+        return x.astype(np.float32) / float(np.iinfo(np.dtype(dtype)).max)
+    return x.astype(np.float32)
+
+# Segnale mono a ~TARGET_SR (decimazione a media per blocchi: basta per l'inviluppo di onset)
+def load_mono(path):
+    path = Path(path)
+    tmp = None
+    try:
+        if path.suffix.lower() == ".wav":
+            off, n, ch, sr, dtype = _wav_layout(path)
+            pcm = np.memmap(path, dtype=dtype, mode="r", offset=off, shape=(n, ch))
+        else:
+            ffmpeg = shutil.which("ffmpeg")
+            if ffmpeg is None:
+                raise RuntimeError("ffmpeg non trovato: solo WAV analizzabili")
+            fd, tmp = tempfile.mkstemp(suffix=".pcm"); os.close(fd)
+            sr, ch, dtype = TARGET_SR, 1, "<i2"
+            subprocess.run([ffmpeg, "-v", "error", "-y", "-i", str(path), "-ac", "1", "-ar", str(sr),
+                            "-f", "s16le", tmp], check=True)
+            n = os.path.getsize(tmp) // 2
+            pcm = np.memmap(tmp, dtype=dtype, mode="r", shape=(n, 1)) if n else np.zeros((0, 1), "<i2")
+        q = max(1, sr // TARGET_SR)
+        m = (len(pcm) // q) * q
+        mono = _to_float(pcm[:m], dtype).mean(axis=1)
+        del pcm
+        return mono.reshape(-1, q).mean(axis=1) if q > 1 else mono, sr / q
+    finally:
+        if tmp:
+            os.remove(tmp)
+
+# ----------------------------------------------------------------------------------------
+# Feature
+
+def _frames(x):
+    if len(x) < N_FFT:
+        x = np.pad(x, (0, N_FFT - len(x)))
+    return np.lib.stride_tricks.sliding_window_view(x, N_FFT)[::HOP] * np.hanning(N_FFT).astype(np.float32)
+
+# Inviluppo di onset: flusso spettrale positivo su magnitudini log-compresse, media locale rimossa
+def onset_strength(S):
+    L = np.log1p(100.0 * S)
+    flux = np.maximum(0.0, np.diff(L, axis=0)).mean(axis=1)
+    w = 16
+    local = np.convolve(flux, np.ones(w) / w, mode="same") if len(flux) > w else np.full_like(flux, flux.mean() if len(flux) else 0.0)
+    return np.maximum(0.0, flux - local)
+
+# Tempo = picco dell'autocorrelazione dell'inviluppo nel range BPM, pesato da un prior attorno a 120.
+# Restituisce anche la "chiarezza" del pulse (autocorrelazione normalizzata al picco, 0–1).
+def tempo(onset, fps):
+    o = np.convolve(onset, np.hanning(7), mode="same")  # picchi larghi qualche frame: periodi non interi
+    o = o - o.mean()
+    n = len(o)
+    if n < 4 or not np.any(o):
+        return None, 0.0
+    f = np.fft.rfft(o, 2 * n)
+    ac = np.fft.irfft(f * np.conj(f))[:n]
+    if ac[0] <= 0:
+        return None, 0.0
+    lo = max(1, int(np.floor(60.0 * fps / BPM_MAX)))
+    hi = min(n - 2, int(np.ceil(60.0 * fps / BPM_MIN)))
+    if hi <= lo:
+        return None, 0.0
+    # un periodo vero si ripete anche al doppio del lag (scarta i 3/2); premiare la metà del lag
+    # invece spingerebbe al mezzo tempo, perché il periodo doppio contiene sempre quello vero
+    acp = np.maximum(ac, 0.0)
+    acm = np.maximum(np.maximum(acp, np.roll(acp, 1)), np.roll(acp, -1))   # 2×lag non intero: ±1 frame
+    score = acp[:hi + 1].copy()
+    score[lo:] += 0.5 * acm[np.minimum(2 * np.arange(lo, hi + 1), n - 2)]
+    lags = np.arange(lo, hi + 1)
+    bpms = 60.0 * fps / lags
+    prior = np.exp(-0.5 * (np.log2(bpms / BPM_PRIOR) / BPM_PRIOR_OCT) ** 2)
+    best = int(lags[np.argmax(score[lo:] * prior)])
+    # ottava: il tempo doppio (lag dimezzato) vince se periodico quasi quanto → sprint a 150–180 BPM
+    # non finiscono a 75–90; in un brano a 90 BPM il mezzo battito non ha onset e non passa
+    h = best // 2
+    if h - 1 >= lo:
+        fast = h - 1 + int(np.argmax(score[h - 1:h + 2]))
+        if score[fast] >= OCTAVE_RATIO * score[best]:
+            best = fast
+    lag = float(best)
+    a, b, c = ac[best - 1], ac[best], ac[best + 1]   # interpolazione parabolica
+    den = a - 2 * b + c
+    if den < 0:
+        lag += 0.5 * (a - c) / den
+    return 60.0 * fps / lag, float(np.clip(b / ac[0], 0.0, 1.0))
+
+def analyze_signal(x, sr):
+    if len(x) == 0:
+        return {"bpm": None, "danceability": None, "valence": None, "energy": None}
+    S = np.abs(np.fft.rfft(_frames(x), axis=1))
+    fps = sr / HOP
+    bpm, clarity = tempo(onset_strength(S), fps)
+
+    rms_db = 20 * np.log10(max(1e-9, float(np.sqrt(np.mean(x.astype(np.float64) ** 2)))))
+    energy = float(np.clip((rms_db + 40.0) / 34.0, 0.0, 1.0))        # -40 dBFS → 0, -6 dBFS → 1
+    freqs = np.fft.rfftfreq(N_FFT, 1.0 / sr)
+    tot = S.sum(axis=1)
+    centroid = float(np.median((S @ freqs)[tot > 0] / tot[tot > 0])) if np.any(tot > 0) else 0.0
+    brightness = float(np.clip(centroid / (sr / 4), 0.0, 1.0))
+
+    # Proxy: danceability = pulse regolare (chiarezza) a un tempo "ballabile", modulato dall'energia;
+    # valence = luminosità timbrica + energia (stima grezza, nessun modello di armonia/modo)
+    if bpm is None:
+        dance = 0.3 * energy
+    else:
+        tempo_fit = float(np.exp(-0.5 * (np.log2(bpm / 118.0) / 0.45) ** 2))
+        dance = float(np.clip(0.55 * min(1.0, 2.0 * clarity) + 0.30 * tempo_fit + 0.15 * energy, 0.0, 1.0))
+    valence = float(np.clip(0.6 * brightness + 0.4 * energy, 0.0, 1.0))
+    r = lambda v: None if v is None else round(float(v), 3)
+    return {"bpm": r(bpm), "danceability": r(dance), "valence": r(valence), "energy": r(energy)}
+
+def analyze_file(path):
+    x, sr = load_mono(path)
+    return analyze_signal(x, sr)
+
+# ----------------------------------------------------------------------------------------
+# Cache per hash del contenuto (blake2b) + ANALYSIS_VERSION; l'indice path → (size, mtime) evita di ricalcolare
+# l'hash dei file non toccati, quindi un re-run su migliaia di file è quasi solo I/O di metadati.
+
+def content_hash(path, chunk=1 << 20):
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk), b""):
+            h.update(block)
+    return h.hexdigest()
+
+class AudioCache:
+    def __init__(self, path=AUDIO_CACHE_PATH):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(str(self.path))
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, hash TEXT);
+            CREATE TABLE IF NOT EXISTS analysis (hash TEXT PRIMARY KEY, bpm REAL, danceability REAL,
+                                                 valence REAL, energy REAL);
+        """)
+
+    def close(self):
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def file_hash(self, path):
+        st = os.stat(path)
+        key = str(Path(path).resolve())
+        row = self._db.execute("SELECT size, mtime_ns, hash FROM files WHERE path=?", (key,)).fetchone()
+        if row and row[0] == st.st_size and row[1] == st.st_mtime_ns:
+            return row[2]
+        h = content_hash(path)
+        with self._db:
+            self._db.execute("INSERT OR REPLACE INTO files VALUES (?,?,?,?)", (key, st.st_size, st.st_mtime_ns, h))
+        return h
+
+    def get(self, h):
+        row = self._db.execute("SELECT bpm, danceability, valence, energy FROM analysis WHERE hash=?",
+                               (f"{h}/v{ANALYSIS_VERSION}",)).fetchone()
+        return None if row is None else dict(zip(("bpm", "danceability", "valence", "energy"), row))
+
+    def put(self, h, feat):
+        with self._db:
+            self._db.execute("INSERT OR REPLACE INTO analysis VALUES (?,?,?,?,?)",
+                             (f"{h}/v{ANALYSIS_VERSION}", feat["bpm"], feat["danceability"], feat["valence"], feat["energy"]))
+
+def _safe_analyze(path):
+    try:
+        return analyze_file(path), None
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}"
+
+# Analizza i file (cache per contenuto, mancanti in un pool di processi) → {path: feature}
+def analyze_files(paths, cache=None, workers=None):
+    paths = [Path(p) for p in paths]
+    own = cache is None
+    cache = cache or AudioCache()
+    try:
+        hashes = {p: cache.file_hash(p) for p in paths}
+        out, todo = {}, {}
+        for p, h in hashes.items():
+            hit = cache.get(h)
+            if hit is not None: out[p] = hit
+            else: todo.setdefault(h, p)   # file identici analizzati una volta
+        if todo:
+            items = list(todo.items())
+            files = [p for _, p in items]
+            if workers == 1 or len(files) == 1:
+                results = list(map(_safe_analyze, files))
+            else:
+                with ProcessPoolExecutor(max_workers=workers) as ex:
+                    results = list(ex.map(_safe_analyze, files, chunksize=4))
+            done = {}
+            for (h, p), (feat, err) in zip(items, results):
+                if err is not None:
+                    print(f"❌ Analisi fallita {p.name}: {err}")
+                    continue
+                cache.put(h, feat); done[h] = feat
+            for p, h in hashes.items():
+                if p not in out and h in done: out[p] = done[h]
+        return out
+    finally:
+        if own: cache.close()
+
+def audio_files(folder):
+    folder = Path(folder)
+    if not folder.is_dir():
+        return []
+    return sorted(p for p in folder.iterdir() if p.suffix.lower() in AUDIO_EXT)
+
+# Backend "local" per features.FeatureProvider: file <track_id>.<ext> nella cartella audio
+class LocalAudioFeatures:
+    name = "local"
+
+    def __init__(self, folder=AUDIO_DIR, workers=None):
+        self.folder, self.workers = Path(folder), workers
+        self._files = None
+
+    def lookup(self, tracks):
+        if self._files is None:
+            self._files = {p.stem: p for p in audio_files(self.folder)}
+        wanted = {tid: self._files[tid] for tid, _ in tracks if tid in self._files}
+        if not wanted:
+            return {}
+        res = analyze_files(wanted.values(), workers=self.workers)
+        return {tid: {k: res[p][k] for k in ("bpm", "danceability", "valence")}
+                for tid, p in wanted.items() if p in res}
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Analisi locale (BPM, danceability, valence) di file audio.")
+    ap.add_argument("folder", type=Path, nargs="?", default=Path(AUDIO_DIR))
+    ap.add_argument("--out", type=Path, default=Path("output/audio_features.json"))
+    ap.add_argument("--workers", type=int, default=None)
+    args = ap.parse_args()
+
+    files = audio_files(args.folder)
+    res = analyze_files(files, workers=args.workers)
+    dump = {p.stem: res[p] for p in files if p in res}
+    args.out.parent.mkdir(parents=True, exist_ok=True)
+    args.out.write_text(json.dumps(dump, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"🎧 Analizzati {len(dump)}/{len(files)} file → {args.out}")
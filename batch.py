@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+   batch.py — playlist per tutte le lezioni di un calendario in una sola esecuzione
+
+   Uso:  python batch.py schedule.json [--catalog output/tracks_by_genre.json] [--out output/runs]
+                         [--workers N] [--no-ratings] [--rating-cache]
+   schedule.json: lista di lezioni
+     [{"class_id": "lun-0900", "instructor": "profiles/istruttore.json", "participants": ["Giulia Costa", ...], "seed": 42},
+      {"class_id": "lun-1800", "instructor": "Giulia Costa", "seed": 7}]
+   instructor = file profilo JSON o nome in personas.json; senza participants si estraggono class_size
+   (default CLASS_SIZE) partecipanti col seed della lezione (stesso risultato di main.py --seed).
+   "minutes" facoltativo: durata della sessione a tempo (default SESSION_MINUTES).
+   Output in <out>/<class_id>/ (4 file di ranking + 2 sessioni + log.txt) e riepilogo in <out>/batch_summary.json.
+
+   Catalogo condiviso in sola lettura per scelta tramite fork copia-su-scrittura (come i segmenti in
+   ranking.run_segments), non multiprocessing.shared_memory: id, titoli e artisti del Catalog sono liste di
+   stringhe Python, che uno shared_memory non può ospitare senza riscrivere il Catalog. Gli array NumPy
+   restano pagine condivise finché nessuno li scrive; le stringhe lette dai worker vengono copiate pagina
+   per pagina (contatori di riferimento). Dove fork non esiste (Windows, macOS con spawn di default) ogni
+   worker riceve una copia serializzata del catalogo all'avvio, una volta, non a ogni lezione.
+"""
+
+import argparse
+import contextlib
+import json
+import multiprocessing
+import random
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import ranking
+import sequencer
+from catalog import Catalog
+from config import SESSION_MINUTES
+from genre_ranges import FEATURE_RANGES_CSV, read_genre_ranges
+
+RUNS_DIR = Path("output/runs")
+CLASS_ID = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_.-]*$")   # usato come nome di cartella
+
+# Stato del worker: catalogo e tolleranze caricati una volta dal processo padre.
+# Con fork (forzato dove disponibile, vedi docstring) i worker li ereditano in copia-su-scrittura;
+# con spawn arrivano una volta per worker tramite l'initializer.
+_STATE = {}
+
+def _init_worker(catalog, ranges, personas, dump_ratings, ratings_fmt, rating_cache, seg_workers):
+    _STATE.update(catalog=catalog, tolerances=ranking.tolerances_from_ranges(ranges), personas=personas)
+    ranking.DUMP_RATINGS, ranking.RATINGS_FMT, ranking.SEG_WORKERS = dump_ratings, ratings_fmt, seg_workers
+    ranking.USE_RATING_CACHE = rating_cache   # connessione SQLite aperta dal worker stesso
+
+# Calendario → lezioni validate (coach e partecipanti risolti qui, errori prima di partire)
+def load_schedule(path, personas, instr_path=ranking.INSTR_PATH):
+    raw = ranking.jload(Path(path))
+    by_name = {p.get("nome"): p for p in personas}
+    jobs, seen = [], set()
+    for i, c in enumerate(raw):
+        cid = str(c.get("class_id", ""))
+        if not CLASS_ID.match(cid) or cid in seen:
+            raise SystemExit(f"❌ Lezione {i}: class_id mancante, non valido o duplicato ({cid!r})")
+        seen.add(cid)
+        instr = c.get("instructor") or str(instr_path)
+        if Path(instr).is_file(): coach = ranking.jload(Path(instr))
+        elif instr in by_name:    coach = by_name[instr]
+        else: raise SystemExit(f"❌ {cid}: istruttore non trovato ({instr})")
+        names = c.get("participants")
+        cls = None
+        if names is not None:
+            missing = [n for n in names if n not in by_name]
+            if missing: raise SystemExit(f"❌ {cid}: partecipanti sconosciuti: {', '.join(missing)}")
+            cls = [dict(coach, _is_instructor=True)] + \
+                  [dict(by_name[n], _is_instructor=False) for n in names if n != coach.get("nome")]
+        seed = c.get("seed")
+        if seed is None: seed = random.SystemRandom().randrange(2**32)   # annotato nel riepilogo
+        jobs.append({"class_id": cid, "coach": coach, "class": cls, "seed": int(seed),
+                     "n": c.get("class_size"), "minutes": c.get("minutes")})
+    return jobs
+
+# Una lezione nel worker: stessi passi di main.py (seed → classe → ranking → 4 file + sessioni), log su file
+def run_class(job, out_root):
+    out = Path(out_root) / job["class_id"]
+    out.mkdir(parents=True, exist_ok=True)
+    t = time.perf_counter()
+    with (out / "log.txt").open("w", encoding="utf-8") as log, contextlib.redirect_stdout(log):
+        random.seed(job["seed"])
+        print(f"🔁 Seed riproducibile: {job['seed']}")
+        personas = job["class"] or ranking.sample_class(job["coach"], _STATE["personas"], job["n"])
+        names = [p.get("nome",f"p{i}") for i,p in enumerate(personas)]
+        print(f"\n👤 Coach: {names[0]}  |  Partecipanti ({len(names)-1}): {ranking.names_label(names[1:])}")
+        res = ranking.run_full(_STATE["catalog"], personas, aggregators=("awm","mrp"),
+                               coach=True, tolerances=_STATE["tolerances"])
+        ranking.write_class_outputs(res["awm"], names[1:],
+                                    out / "ranking_class.json", out / "individual_ratings.json")
+        ranking.write_instructor_outputs(res["mrp"], names,
+                                         out / "ranking_instructor.json", out / "individual_ratings_instructor.json")
+        minutes = job.get("minutes") or SESSION_MINUTES
+        sequencer.write_session(res["awm"], out / "session_class.json", minutes)
+        sequencer.write_session(res["mrp"], out / "session_instructor.json", minutes)
+    return {"class_id": job["class_id"], "seed": job["seed"], "coach": names[0], "participants": names[1:],
+            "Voto_medio_AWM": round(res["awm"]["means"], 3),
+            "Voto_medio_MRP": [round(v, 3) for v in res["mrp"]["means"]],
+            "wall_s": round(time.perf_counter() - t, 3), "dir": str(out)}
+
+def _run_class(args):
+    job, out_root = args
+    try:
+        return run_class(job, out_root), None
+    except (Exception, SystemExit) as e:
+        return None, f"{type(e).__name__}: {e}"
+
+# Lezioni in un pool di processi (workers=1 → nello stesso processo); riepilogo in <out>/batch_summary.json
+def run_batch(jobs, catalog, ranges, personas, out_root=RUNS_DIR, workers=None, dump_ratings=None):
+    out_root = Path(out_root)
+    out_root.mkdir(parents=True, exist_ok=True)
+    if not isinstance(catalog, Catalog):   # array compatti condivisi da tutte le lezioni
+        catalog = Catalog.from_records(catalog)
+    init = (catalog, ranges, personas, ranking.DUMP_RATINGS if dump_ratings is None else dump_ratings,
+            ranking.RATINGS_FMT, ranking.USE_RATING_CACHE)
+    tasks = [(j, out_root) for j in jobs]
+    t, ex = time.perf_counter(), None
+    if workers == 1 or len(jobs) <= 1:
+        _init_worker(*init, ranking.SEG_WORKERS)
+        results = map(_run_class, tasks)
+    else:   # parallelismo sulle lezioni: segmenti in serie dentro ogni worker
+        fork = "fork" in multiprocessing.get_all_start_methods()
+        ex = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=init + (1,),
+                                 mp_context=multiprocessing.get_context("fork") if fork else None)
+        results = ex.map(_run_class, tasks)
+    summary, failed = [], 0
+    try:
+        for job, (res, err) in zip(jobs, results):
+            if err is not None:
+                failed += 1
+                print(f"❌ {job['class_id']}: {err}")
+                continue
+            summary.append(res)
+            print(f"✅ {res['class_id']}: coach {res['coach']}, {len(res['participants'])} partecipanti, "
+                  f"AWM {res['Voto_medio_AWM']}  ({res['wall_s']:.1f}s) → {res['dir']}")
+    finally:
+        if ex is not None: ex.shutdown()
+    wall = time.perf_counter() - t
+    (out_root / "batch_summary.json").write_text(
+        json.dumps({"classes": summary, "failed": failed, "wall_s": round(wall, 3)}, ensure_ascii=False, indent=2),
+        encoding="utf-8")
+    print(f"\n📦 Lezioni: {len(summary)} ok, {failed} fallite in {wall:.1f}s  →  {out_root / 'batch_summary.json'}")
+    return summary
+
+def main():
+    ap = argparse.ArgumentParser(description="Playlist per tutte le lezioni di un calendario.")
+    ap.add_argument("schedule", type=Path, help="Calendario JSON: class_id, instructor, participants, seed")
+    ap.add_argument("--catalog", type=Path, default=ranking.TRACKS_PATH)
+    ap.add_argument("--out", type=Path, default=RUNS_DIR, help="Cartella degli output per lezione")
+    ap.add_argument("--workers", type=int, default=None, help="Processi (default: uno per core)")
+    ap.add_argument("--no-ratings", action="store_true", default=not ranking.DUMP_RATINGS,
+                    help="Niente voti per partecipante nei dump individual_ratings*.json")
+    ap.add_argument("--ratings-format", choices=("json", "npz", "jsonl.gz"), default=ranking.RATINGS_FMT,
+                    help="Dump dei voti: json leggibile o colonnare (npz, jsonl.gz)")
+    ap.add_argument("--rating-cache", action="store_true", default=ranking.USE_RATING_CACHE,
+                    help="Riusa tra lezioni e run le componenti voto persona × brano (output/rating_cache.sqlite)")
+    args = ap.parse_args()
+    ranking.RATINGS_FMT, ranking.USE_RATING_CACHE = args.ratings_format, args.rating_cache
+
+    personas = ranking.jload(ranking.PERSONAS_PATH)
+    jobs = load_schedule(args.schedule, personas)
+    catalog = ranking.jload(args.catalog)
+    ranges = read_genre_ranges(FEATURE_RANGES_CSV)
+    print(f"📅 {len(jobs)} lezioni, catalogo {len(catalog)} brani ({args.catalog})")
+    failed = len(jobs) - len(run_batch(jobs, catalog, ranges, personas, args.out, args.workers,
+                                       dump_ratings=not args.no_ratings))
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+   bench_ranking.py — benchmark del ranking su carico sintetico (catalogo + personas generati)
+
+   Uso:  python bench_ranking.py [--tracks 1000 10000] [--personas 10 100] [--repeat 3]
+                                 [--baseline output/bench_baseline.json] [--save-baseline] [--threshold 0.25]
+   Tempi per stadio (run_full, run_segment, prefiltro, scoring, aggregazione) in entrambe le modalità:
+   Entrambe con il coach in prima riga, come main.py e batch.py: awm = vista solo studenti (target, prefiltro
+   e voti senza il coach), mrp = classe intera. Exit code 1 se uno stadio regredisce oltre la soglia.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import random
+import sys
+import time
+from pathlib import Path
+
+import ranking
+from config import GENRE_TO_MACROGENRE
+from genre_ranges import complete_ranges, read_genre_ranges
+from scoring import BALLO_MAP, RITMO_MAP, UMORE_MAP
+
+OUT_PATH      = Path("output/bench_ranking.json")
+BASELINE_PATH = Path("output/bench_baseline.json")
+MIN_DELTA_S   = 0.005   # sotto i 5 ms la differenza è rumore, non regressione
+
+# Picco di memoria misurato su questa pipeline: ~3.5 KB per brano (record, Catalog, dict dei segmenti)
+# + ~120 B per coppia persona × brano (componenti, epsilon, voti del segmento). Le matrici P×T sono
+# dense: 1M brani × 1000 personas (~120 GB) resta fuori portata, 1M × 10 chiede ~5 GB (--max-gb 6)
+BYTES_PER_TRACK, BYTES_PER_PAIR = 3500, 120
+
+def est_gb(T, P):
+    return (BYTES_PER_TRACK * T + BYTES_PER_PAIR * T * (P + 1)) / 1e9
+
+# Catalogo sintetico: generi del CSV presenti nella mappa macro-generi, feature uniformi nei range,
+# ~1% di BPM mancanti (imputazione) e un brano preferito per ciascuno dei primi `n_fav` nomi.
+def synth_catalog(n, seed=0, fav_names=()):
+    rng = random.Random(seed)
+    ranges = complete_ranges(read_genre_ranges())
+    genres = [g for g in ranges if g in GENRE_TO_MACROGENRE]
+    out = []
+    for i in range(n):
+        g = rng.choice(genres)
+        r = ranges[g]
+        out.append({
+            "title": f"Synth {i}", "artist": f"Artist {i % 997}", "genre": g, "id": f"syn{i:07d}",
+            "bpm": None if rng.random() < 0.01 else round(rng.uniform(*r["bpm"]), 3),
+            "danceability": round(rng.uniform(*r["danceability"]), 3),
+            "valence": round(rng.uniform(*r["valence"]), 3),
+        })
+    for t, name in zip(out, fav_names):
+        t["note"] = f"## BRANO PREFERITO DI {name}"
+    return out
+
+# Personas sintetiche nello schema di profiles/personas.json
+def synth_personas(n, seed=0, prefix="Persona"):
+    rng = random.Random(seed)
+    genres = list(GENRE_TO_MACROGENRE)
+    return [{
+        "nome": f"{prefix} {i:04d}",
+        "genere": rng.choice("MF"),
+        "età": rng.randint(18, 65),
+        "generi_preferiti": rng.sample(genres, 10),
+        "ruolo": rng.choice(["adattabile", "protestante"]),
+        "tolleranza": round(rng.uniform(0.2, 0.9), 2),
+        "brani_preferiti": [],
+        "ritmo_preferito": rng.choice(list(RITMO_MAP)),
+        "ballabilità": rng.choice(list(BALLO_MAP)),
+        "umore_musicale": rng.choice(list(UMORE_MAP)),
+    } for i in range(n)]
+
+def _timed(fn):
+    t = time.perf_counter()
+    out = fn()
+    return time.perf_counter() - t, out
+
+# Tempi (s) di ogni stadio per una modalità; i segmenti sono sommati. personas[0] è il coach:
+# awm misura la vista solo studenti (STUDENTS sulle componenti della classe intera), mrp la classe intera
+def bench_mode(mode, tracks, personas, tolerances):
+    aggs = (mode,)
+    times = {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        times["run_full"], _ = _timed(lambda: ranking.run_full(tracks, personas, aggs, True, tolerances))
+        # run_full ha impostato indice BPM, tabella generi e tolleranze della classe
+        valid = set(GENRE_TO_MACROGENRE)
+        tr = [t for t in tracks if t.get("genre") in valid]
+        cls_t = ranking.class_targets(personas)
+        stu_t = ranking.class_targets(personas[1:])
+        if mode == "awm": view = dict(personas=personas[1:], targets=stu_t, coach=False, rows=ranking.STUDENTS)
+        else:             view = dict(personas=personas, targets=cls_t, coach=True, rows=slice(None))
+        times["components"], cc = _timed(lambda: ranking.build_components(tr, personas))
+        for k in ("prefilter", "scoring", "aggregate", "run_segment"):
+            times[k] = 0.0
+        for seg in ranking.SEGMENTS:
+            seg_t = ranking.segment_targets(seg, view["targets"])
+            dt, cols = _timed(lambda: ranking.prefilter(seg, cc, seg_t))
+            times["prefilter"] += dt
+            dt, _ = _timed(lambda: cc.ratings(cols, ranking.segment_bias_weights(seg), seg_t, view["rows"]))
+            times["scoring"] += dt
+            st = ranking.score_segment(seg, tr, view["personas"], view["targets"], coach=view["coach"], cc=cc,
+                                       rows=view["rows"])
+            dt, _ = _timed(lambda: ranking.aggregate_segment(st, mode))
+            times["aggregate"] += dt
+            dt, _ = _timed(lambda: ranking.run_segment(seg, tr, personas, cls_t, aggs, True, cc,
+                                                       student_targets=stu_t))
+            times["run_segment"] += dt
+    return times
+
+# → (tempi per stadio, combinazioni saltate perché oltre max_gb stimati)
+def run(track_sizes, persona_sizes, repeat=3, seed=0, max_gb=2.0):
+    tolerances = ranking.tolerances_from_ranges(read_genre_ranges())
+    results, skipped = {}, []
+    for P in persona_sizes:
+        coach = synth_personas(1, seed + 1, prefix="Coach")
+        students = synth_personas(P, seed)
+        for T in track_sizes:
+            gb = est_gb(T, P)
+            if gb > max_gb:
+                print(f"⏭️  {T} brani × {P} personas: picco stimato ~{gb:.1f} GB > {max_gb} GB (non misurato)")
+                skipped.append({"tracks": T, "personas": P, "est_gb": round(gb, 1)})
+                continue
+            tracks = synth_catalog(T, seed, [p["nome"] for p in students[:5]])
+            for mode, personas in (("awm", coach + students), ("mrp", coach + students)):
+                best = {}
+                for _ in range(repeat):
+                    for k, v in bench_mode(mode, tracks, personas, tolerances).items():
+                        best[k] = min(best.get(k, v), v)
+                for k, v in best.items():
+                    results[f"{mode}/{T}x{P}/{k}"] = round(v, 6)
+                print(f"⏱️  {mode} {T:>8} brani × {P:>4} personas  " +
+                      "  ".join(f"{k}={v*1000:.1f}ms" for k, v in best.items()))
+    return results, skipped
+
+# Stadi più lenti della baseline oltre la soglia relativa (e oltre MIN_DELTA_S in assoluto)
+def regressions(results, baseline, threshold):
+    out = []
+    for k, v in results.items():
+        b = baseline.get(k)
+        if b is not None and v > b * (1 + threshold) and v - b > MIN_DELTA_S:
+            out.append((k, b, v))
+    return out
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark del ranking su catalogo e personas sintetici.")
+    ap.add_argument("--tracks", type=int, nargs="+", default=[1000, 10000],
+                    help="Dimensioni del catalogo (1M solo con poche personas e --max-gb alto)")
+    ap.add_argument("--personas", type=int, nargs="+", default=[10, 100],
+                    help="Partecipanti per classe (fino a 1000)")
+    ap.add_argument("--repeat", type=int, default=3, help="Ripetizioni per misura (si tiene il minimo)")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--max-gb", type=float, default=2.0,
+                    help="Salta le combinazioni con picco di memoria stimato oltre questa soglia")
+    ap.add_argument("--out", type=Path, default=OUT_PATH)
+    ap.add_argument("--baseline", type=Path, default=BASELINE_PATH)
+    ap.add_argument("--save-baseline", action="store_true", help="Salva i risultati come nuova baseline")
+    ap.add_argument("--threshold", type=float, default=0.25, help="Regressione tollerata (0.25 = +25%%)")
+    args = ap.parse_args()
+
+    results, skipped = run(args.tracks, args.personas, args.repeat, args.seed, args.max_gb)
+    doc = {"python": sys.version.split()[0], "repeat": args.repeat, "seed": args.seed, "max_gb": args.max_gb,
+           "results": results, "skipped": skipped}
+    args.out.parent.mkdir(parents=True, exist_ok=True)
+    args.out.write_text(json.dumps(doc, indent=2), encoding="utf-8")
+    print(f"✅ Salvato: {args.out}")
+
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps(doc, indent=2), encoding="utf-8")
+        print(f"✅ Baseline aggiornata: {args.baseline}")
+        return
+    if not args.baseline.exists():
+        print(f"ℹ️  Nessuna baseline in {args.baseline} (usa --save-baseline)")
+        return
+    bad = regressions(results, json.loads(args.baseline.read_text(encoding="utf-8"))["results"], args.threshold)
+    for k, b, v in bad:
+        print(f"❌ Regressione {k}: {b*1000:.1f} ms → {v*1000:.1f} ms (+{(v/b-1)*100:.0f}%)")
+    if bad:
+        sys.exit(1)
+    print(f"✅ Nessuna regressione oltre il {args.threshold*100:.0f}% rispetto a {args.baseline}")
+
+if __name__ == "__main__":
+    main()
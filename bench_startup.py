@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+   bench_startup.py — tempo di import a freddo per entry point (python -X importtime)
+
+   Uso:  python bench_startup.py [--runs 5] [--budget-ms 150] [--json out.json]
+   Ogni import gira in un interprete nuovo; si riporta la mediana. Il budget vale per il
+   percorso di solo ranking (ranking, rank_playlist, rank_instructor): exit code 1 se superato.
+   Quel percorso importa numpy, che da solo costa ~80–95 ms a freddo (misurato su Linux, Python 3.11):
+   con ~15 ms di moduli del progetto si arriva a 100–120 ms, quindi il budget è 150 ms e non 100.
+   Gli entry point in LIGHT (main per --help e parsing, estrazione) non devono importare numpy affatto.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent
+
+ENTRY_POINTS = ["ranking", "rank_playlist", "rank_instructor", "main", "extract_tracks",
+                "features", "audio_analysis", "counter_genre"]
+RANK_PATH = {"ranking", "rank_playlist", "rank_instructor"}
+HEAVY = ("numpy", "pandas", "spotipy", "matplotlib")
+LAZY  = ("pandas", "spotipy", "matplotlib")   # non devono comparire in nessun import a freddo
+LIGHT = {"main", "extract_tracks", "features", "counter_genre"}   # senza numpy: ranking solo quando serve
+
+# Bytecode sempre scritto: si misura un avvio a freddo di un'installazione normale, non la compilazione
+_ENV = {k: v for k, v in os.environ.items() if k != "PYTHONDONTWRITEBYTECODE"}
+
+# Un import in un interprete nuovo → {modulo: µs cumulativi} dalle righe di -X importtime
+def import_times(module):
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                          cwd=ROOT, capture_output=True, text=True, env=_ENV)
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {module} fallito:\n{proc.stderr.strip().splitlines()[-1]}")
+    times = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cum, name = line.split("|")
+        name = name.strip()
+        if cum.strip().isdigit() and name not in times:
+            times[name] = int(cum)
+    return times
+
+def bench(module, runs):
+    total, heavy, loaded = [], [], set()
+    import_times(module)  # warm-up: scrive i .pyc mancanti
+    for _ in range(runs):
+        t = import_times(module)
+        total.append(t[module] / 1000)
+        heavy.append(sum(t.get(h, 0) for h in HEAVY) / 1000)
+        loaded |= {h for h in HEAVY if h in t}
+    tot, hv = statistics.median(total), statistics.median(heavy)
+    return {"module": module, "total_ms": round(tot, 1), "deps_ms": round(hv, 1),
+            "project_ms": round(tot - hv, 1), "heavy": sorted(loaded)}
+
+def main():
+    ap = argparse.ArgumentParser(description="Tempo di import a freddo per entry point.")
+    ap.add_argument("--runs", type=int, default=5)
+    ap.add_argument("--budget-ms", type=float, default=150.0,
+                    help="Budget per il percorso di solo ranking, numpy compreso (~80–95 ms da solo)")
+    ap.add_argument("--json", type=Path, default=None, help="Salva i risultati in JSON")
+    ap.add_argument("modules", nargs="*", default=ENTRY_POINTS)
+    args = ap.parse_args()
+
+    rows = [bench(m, args.runs) for m in args.modules]
+    width = max(len(r["module"]) for r in rows)
+    print(f"{'Entry point'.ljust(width)}  totale ms  dipendenze ms  progetto ms  moduli pesanti")
+    for r in rows:
+        print(f"{r['module'].ljust(width)}  {r['total_ms']:9.1f}  {r['deps_ms']:13.1f}  {r['project_ms']:11.1f}  "
+              f"{', '.join(r['heavy']) or '-'}")
+
+    failed = []
+    for r in rows:
+        eager = [h for h in r["heavy"] if h in LAZY or (h == "numpy" and r["module"] in LIGHT)]
+        if eager:
+            failed.append(f"{r['module']}: import non pigri di {', '.join(eager)}")
+        if r["module"] in RANK_PATH and r["total_ms"] > args.budget_ms:
+            failed.append(f"{r['module']}: {r['total_ms']} ms > budget {args.budget_ms} ms")
+
+    if args.json:
+        args.json.write_text(json.dumps({"runs": args.runs, "budget_ms": args.budget_ms, "results": rows},
+                                        indent=2), encoding="utf-8")
+        print(f"✅ Salvato: {args.json}")
+    for f in failed:
+        print(f"❌ {f}")
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+   catalog.py — strutture dati sul catalogo brani
+"""
+
+from collections import defaultdict
+import numpy as np
+from config import GENRE_TO_MACROGENRE
+from scoring import GENRES, GENRE_ID, favorite_owner_from_note, get_macros
+
+DEFAULT_BPM = 110.0
+
+# Indice per l'imputazione BPM: somme/conteggi per genere, aggregati per macro-genere.
+# Stessa semantica di una scansione del catalogo (media dei brani con almeno un
+# macro-genere in comune), ma costruito una volta e aggiornato a ogni add().
+class BpmIndex:
+    def __init__(self, tracks=()):
+        self._sum = defaultdict(float)
+        self._n   = defaultdict(int)
+        self._memo = {}
+        # generi "vicini": condividono almeno un macro-genere
+        macros = {g: set(get_macros(g)) for g in GENRE_TO_MACROGENRE}
+        self._near = {g: [h for h in macros if macros[g] & macros[h]] for g in macros}
+        if isinstance(tracks, Catalog): self.add_catalog(tracks)
+        else: self.add_many(tracks)
+
+    def add(self, track):
+        g = track.get("genre", "")
+        b = track.get("bpm")
+        if g not in self._near or not isinstance(b,(int,float)):
+            return
+        self._sum[g] += b; self._n[g] += 1
+        self._memo.clear()
+
+    def add_many(self, tracks):
+        for t in tracks: self.add(t)
+
+    # Come add_many su un Catalog: somme per codice genere (bincount somma nell'ordine del catalogo)
+    def add_catalog(self, cat):
+        ok = (cat.genre >= 0) & ~np.isnan(cat.bpm)
+        codes = cat.genre[ok]
+        n = np.bincount(codes, minlength=len(cat.genres))
+        s = np.bincount(codes, weights=cat.bpm[ok], minlength=len(cat.genres))
+        for c in np.flatnonzero(n).tolist():
+            g = cat.genres[c]
+            if g in self._near:
+                self._sum[g] += float(s[c]); self._n[g] += int(n[c])
+        self._memo.clear()
+
+    def impute(self, genre):
+        if genre in self._memo:
+            return self._memo[genre]
+        s = n = 0
+        for h in self._near.get(genre, ()):
+            s += self._sum.get(h, 0.0); n += self._n.get(h, 0)
+        val = (s/n) if n else DEFAULT_BPM
+        self._memo[genre] = val
+        return val
+
+def _num(x):
+    return float(x) if isinstance(x,(int,float)) else np.nan
+
+# Catalogo come struct-of-arrays: genere come codice intero (i generi della mappa macro-generi hanno
+# il loro GENRE_ID, gli altri seguono; -1 = assente), feature contigue float64 (NaN = mancante),
+# proprietario del brano preferito come colonna intera su una tabella di nomi (-1 = nessuno).
+# Titoli, artisti e id restano liste di stringhe: i record dict si ricostruiscono solo in export.
+# duration_ms: durata da Spotify (NaN se assente, es. preferiti o cataloghi vecchi).
+class Catalog:
+    __slots__ = ("ids", "titles", "artists", "genre", "bpm", "danceability", "valence", "duration_ms", "fav",
+                 "genres", "owners", "_rows")
+
+    def __init__(self, ids, titles, artists, genre, bpm, danceability, valence, fav, genres, owners,
+                 duration_ms=None):
+        self.ids, self.titles, self.artists = ids, titles, artists
+        self.genre, self.fav = genre, fav
+        self.bpm, self.danceability, self.valence = bpm, danceability, valence
+        self.duration_ms = np.full(len(ids), np.nan) if duration_ms is None else duration_ms
+        self.genres, self.owners = genres, owners
+        self._rows = None
+
+    @classmethod
+    def from_records(cls, records):
+        genres, gcode = list(GENRES), dict(GENRE_ID)
+        owners, ocode = [], {}
+        ids, titles, artists, genre, fav, bpm, dance, val, dur = [], [], [], [], [], [], [], [], []
+        for t in records:
+            g = t.get("genre")
+            if g:
+                c = gcode.get(g)
+                if c is None:
+                    c = gcode[g] = len(genres); genres.append(g)
+            else:
+                c = -1
+            o = favorite_owner_from_note(t.get("note"))
+            if o is not None and o not in ocode:
+                ocode[o] = len(owners); owners.append(o)
+            ids.append(t.get("id")); titles.append(t.get("title")); artists.append(t.get("artist"))
+            genre.append(c); fav.append(-1 if o is None else ocode[o])
+            bpm.append(_num(t.get("bpm"))); dance.append(_num(t.get("danceability"))); val.append(_num(t.get("valence")))
+            dur.append(_num(t.get("duration_ms")))
+        return cls(ids, titles, artists, np.array(genre, dtype=np.int16), np.array(bpm), np.array(dance),
+                   np.array(val), np.array(fav, dtype=np.int32), genres, owners, np.array(dur))
+
+    def __len__(self):
+        return len(self.ids)
+
+    # Sotto-catalogo sulle righe `idx` (tabelle di generi e proprietari condivise)
+    def take(self, idx):
+        idx = np.asarray(idx, dtype=np.int64)
+        rows = idx.tolist()
+        return Catalog([self.ids[i] for i in rows], [self.titles[i] for i in rows], [self.artists[i] for i in rows],
+                       self.genre[idx], self.bpm[idx], self.danceability[idx], self.valence[idx], self.fav[idx],
+                       self.genres, self.owners, self.duration_ms[idx])
+
+    # Brani con genere nella mappa macro-generi
+    def known(self):
+        return self.take(np.flatnonzero((self.genre >= 0) & (self.genre < len(GENRES))))
+
+    # id → prima riga con quell'id
+    def row(self, tid):
+        if self._rows is None:
+            self._rows = {}
+            for i, t in enumerate(self.ids): self._rows.setdefault(t, i)
+        return self._rows.get(tid)
+
+    def genre_name(self, i):
+        c = int(self.genre[i])
+        return self.genres[c] if c >= 0 else None
+
+    def owner(self, i):
+        c = int(self.fav[i])
+        return self.owners[c] if c >= 0 else None
+
+    # Record dict della riga i (solo per export); feature mancanti → None
+    def record(self, i):
+        f = lambda x: None if np.isnan(x) else float(x)
+        rec = {"title": self.titles[i], "artist": self.artists[i], "genre": self.genre_name(i), "id": self.ids[i],
+               "bpm": f(self.bpm[i]), "danceability": f(self.danceability[i]), "valence": f(self.valence[i])}
+        if not np.isnan(self.duration_ms[i]): rec["duration_ms"] = int(self.duration_ms[i])
+        if self.fav[i] >= 0: rec["note"] = f"## BRANO PREFERITO DI {self.owner(i)}"
+        return rec
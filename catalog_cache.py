@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+   catalog_cache.py — cache persistente (SQLite) delle playlist, chiave snapshot_id
+"""
+
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from config import CATALOG_CACHE_TTL
+
+CACHE_PATH = Path("output/catalog_cache.sqlite")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS playlists (
+    playlist_id TEXT PRIMARY KEY,
+    snapshot_id TEXT,
+    fetched_at  REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS playlist_items (
+    playlist_id TEXT NOT NULL,
+    pos         INTEGER NOT NULL,
+    track_id    TEXT NOT NULL,
+    name        TEXT,
+    artist      TEXT,
+    duration_ms INTEGER,
+    PRIMARY KEY (playlist_id, pos)
+);
+"""
+
+# Esiti di playlist(): da dove arrivano gli item
+CACHED, UNCHANGED, FETCHED = "cache", "invariata", "scaricata"
+
+# Item compatti (track_id, name, artist, duration_ms) per playlist + snapshot_id e data di fetch.
+# Una sola connessione condivisa tra i worker del fetch, serializzata da un lock.
+class CatalogCache:
+    def __init__(self, path=CACHE_PATH, ttl=CATALOG_CACHE_TTL, clock=time.time):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._db.executescript(_SCHEMA)
+
+    def close(self):
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def entry(self, playlist_id):
+        with self._lock:
+            return self._db.execute("SELECT snapshot_id, fetched_at FROM playlists WHERE playlist_id=?",
+                                    (playlist_id,)).fetchone()
+
+    def items(self, playlist_id):
+        with self._lock:
+            return self._db.execute("SELECT track_id, name, artist, duration_ms FROM playlist_items "
+                                    "WHERE playlist_id=? ORDER BY pos", (playlist_id,)).fetchall()
+
+    def touch(self, playlist_id):
+        with self._lock, self._db:
+            self._db.execute("UPDATE playlists SET fetched_at=? WHERE playlist_id=?",
+                             (self._clock(), playlist_id))
+
+    def put(self, playlist_id, snapshot_id, items):
+        rows = [(playlist_id, pos, *it) for pos, it in enumerate(items)]
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM playlist_items WHERE playlist_id=?", (playlist_id,))
+            self._db.executemany("INSERT INTO playlist_items VALUES (?,?,?,?,?,?)", rows)
+            self._db.execute("INSERT OR REPLACE INTO playlists VALUES (?,?,?)",
+                             (playlist_id, snapshot_id, self._clock()))
+
+    # Item della playlist secondo la politica di refresh:
+    #   entro il TTL o offline → cache, senza rete;
+    #   altrimenti snapshot() (richiesta leggera): se invariato → cache, se cambiato → fetch()
+    # Restituisce (esito, items).
+    def playlist(self, playlist_id, snapshot, fetch, offline=False):
+        entry = self.entry(playlist_id)
+        if offline:
+            if entry is None:
+                raise LookupError(f"playlist {playlist_id} non in cache (modalità offline)")
+            return CACHED, self.items(playlist_id)
+        if entry is not None and self._clock() - entry[1] < self.ttl:
+            return CACHED, self.items(playlist_id)
+        snap = snapshot()
+        if entry is not None and snap and snap == entry[0]:
+            self.touch(playlist_id)
+            return UNCHANGED, self.items(playlist_id)
+        items = list(fetch())
+        self.put(playlist_id, snap, items)
+        return FETCHED, items
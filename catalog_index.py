@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+   catalog_index.py — indice persistente (SQLite) del catalogo brani per l'aggiornamento incrementale
+
+   Un record per track id (JSON del brano con le feature già risolte, backend che le ha fornite, posizione
+   nel catalogo, playlist di provenienza) e un registro delle modifiche: insert / update / delete con
+   numero di sequenza. Le feature di ripiego (features.UNCACHED_SOURCES) o di origine ignota sono
+   provvisorie: refresh_catalog le risolve di nuovo finché un backend reale non le sostituisce.
+   Per ogni brano anche l'insieme delle playlist lette che lo contengono (memberships): un brano sparito
+   da tutte resta come tombstone (deleted=1, feature conservate) e se ricompare torna vivo senza ricalcolo. changes(since) è il feed per chi tiene cache a valle.
+"""
+
+import json
+import sqlite3
+import time
+from pathlib import Path
+
+from features import FEATURES
+
+INDEX_PATH = Path("output/catalog_index.sqlite")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tracks (
+    track_id    TEXT PRIMARY KEY,
+    pos         INTEGER NOT NULL,
+    playlist_id TEXT,
+    deleted     INTEGER NOT NULL DEFAULT 0,
+    rec         TEXT NOT NULL,
+    source      TEXT
+);
+CREATE INDEX IF NOT EXISTS tracks_pos ON tracks (pos);
+CREATE INDEX IF NOT EXISTS tracks_playlist ON tracks (playlist_id);
+CREATE TABLE IF NOT EXISTS memberships (
+    track_id    TEXT NOT NULL,
+    playlist_id TEXT NOT NULL,
+    PRIMARY KEY (track_id, playlist_id)
+);
+CREATE INDEX IF NOT EXISTS memberships_playlist ON memberships (playlist_id);
+CREATE TABLE IF NOT EXISTS changes (
+    seq      INTEGER PRIMARY KEY AUTOINCREMENT,
+    track_id TEXT NOT NULL,
+    op       TEXT NOT NULL,
+    at       REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+INSERT, UPDATE, DELETE = "insert", "update", "delete"
+MUTABLE = ("title", "artist", "note", "duration_ms")   # aggiornabili in un brano già noto (genere: vince il primo)
+
+# Le modifiche restano nella transazione aperta fino a commit(): una run di merge è atomica
+class CatalogIndex:
+    def __init__(self, path=INDEX_PATH, clock=time.time):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._clock = clock
+        self._db = sqlite3.connect(str(self.path))
+        legacy = self._db.execute("SELECT 1 FROM sqlite_master WHERE name='tracks'").fetchone() is not None and \
+                 self._db.execute("SELECT 1 FROM sqlite_master WHERE name='memberships'").fetchone() is None
+        self._db.executescript(_SCHEMA)
+        if legacy:   # indici precedenti: la sola playlist di provenienza
+            self._db.execute("INSERT OR IGNORE INTO memberships SELECT track_id, playlist_id FROM tracks "
+                             "WHERE playlist_id IS NOT NULL")
+            self._db.commit()
+        if "source" not in {r[1] for r in self._db.execute("PRAGMA table_info(tracks)")}:   # indici precedenti
+            self._db.execute("ALTER TABLE tracks ADD COLUMN source TEXT")
+        self.next_pos = self._db.execute("SELECT COALESCE(MAX(pos), -1) + 1 FROM tracks").fetchone()[0]
+
+    def close(self):
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        if exc[0] is None: self.commit()
+        else: self._db.rollback()
+        self.close()
+
+    def commit(self):
+        self._db.commit()
+
+    def __len__(self):
+        return self._db.execute("SELECT COUNT(*) FROM tracks WHERE deleted=0").fetchone()[0]
+
+    def seq(self):
+        return self._db.execute("SELECT COALESCE(MAX(seq), 0) FROM changes").fetchone()[0]
+
+    def meta(self, key, default=None):
+        row = self._db.execute("SELECT value FROM meta WHERE key=?", (key,)).fetchone()
+        return default if row is None else json.loads(row[0])
+
+    def set_meta(self, key, value):
+        self._db.execute("INSERT OR REPLACE INTO meta VALUES (?,?)", (key, json.dumps(value)))
+
+    # (record, tombstone?) o None: anche i tombstone contano come "già noti"
+    def get(self, tid):
+        row = self._db.execute("SELECT rec, deleted FROM tracks WHERE track_id=?", (tid,)).fetchone()
+        return None if row is None else (json.loads(row[0]), bool(row[1]))
+
+    # Backend delle feature salvate (None: importate dal JSON o da un indice precedente)
+    def source(self, tid):
+        row = self._db.execute("SELECT source FROM tracks WHERE track_id=?", (tid,)).fetchone()
+        return None if row is None else row[0]
+
+    def _log(self, tid, op):
+        self._db.execute("INSERT INTO changes (track_id, op, at) VALUES (?,?,?)", (tid, op, self._clock()))
+
+    # Brano nuovo (feature già risolte da `source`) in coda al catalogo
+    def insert(self, rec, playlist_id=None, source=None):
+        self._db.execute("INSERT INTO tracks (track_id, pos, playlist_id, deleted, rec, source) VALUES (?,?,?,0,?,?)",
+                         (rec["id"], self.next_pos, playlist_id, json.dumps(rec, ensure_ascii=False), source))
+        self.next_pos += 1
+        if playlist_id is not None:
+            self._db.execute("INSERT OR IGNORE INTO memberships VALUES (?,?)", (rec["id"], playlist_id))
+        self._log(rec["id"], INSERT)
+        return INSERT
+
+    # Brano già noto rivisto in questa run: tombstone → di nuovo vivo (insert), campi MUTABLE cambiati
+    # → update; genere e feature restano quelli salvati, salvo `source` (feature di rec risolte di
+    # nuovo da quel backend). None = nessuna modifica
+    def merge(self, rec, playlist_id=None, source=None):
+        old, deleted = self.get(rec["id"])
+        new = dict(old)
+        for k in MUTABLE + (FEATURES if source is not None else ()):
+            if rec.get(k) is not None: new[k] = rec[k]
+        if playlist_id is not None:
+            self._db.execute("INSERT OR IGNORE INTO memberships VALUES (?,?)", (rec["id"], playlist_id))
+        if source is not None and source != self.source(rec["id"]):
+            self._db.execute("UPDATE tracks SET source=? WHERE track_id=?", (source, rec["id"]))
+        if not deleted and new == old:
+            return None
+        op = INSERT if deleted else UPDATE
+        self._db.execute("UPDATE tracks SET rec=?, deleted=0, playlist_id=COALESCE(?, playlist_id) WHERE track_id=?",
+                         (json.dumps(new, ensure_ascii=False), playlist_id, rec["id"]))
+        self._log(rec["id"], op)
+        return op
+
+    # Aggiorna le memberships con la composizione completa delle playlist lette ({playlist_id: {id}})
+    # e mette in tombstone i brani vivi rimasti senza alcuna playlist → id rimossi. Un brano spostato in
+    # un'altra playlist letta, o presente anche in una playlist non letta in questa run, resta vivo
+    def tombstone_missing(self, members):
+        left = set()
+        for playlist_id, ids in members.items():
+            self._db.executemany("INSERT OR IGNORE INTO memberships SELECT track_id, ? FROM tracks WHERE track_id=?",
+                                 ((playlist_id, tid) for tid in ids))
+        for playlist_id, ids in members.items():
+            out = [tid for (tid,) in self._db.execute("SELECT track_id FROM memberships WHERE playlist_id=?",
+                                                      (playlist_id,)).fetchall() if tid not in ids]
+            self._db.executemany("DELETE FROM memberships WHERE track_id=? AND playlist_id=?",
+                                 ((tid, playlist_id) for tid in out))
+            left.update(out)
+        gone = [tid for tid in sorted(left)
+                if self._db.execute("SELECT 1 FROM memberships WHERE track_id=?", (tid,)).fetchone() is None
+                and self._db.execute("SELECT 1 FROM tracks WHERE track_id=? AND deleted=0", (tid,)).fetchone()]
+        for tid in gone:
+            self._db.execute("UPDATE tracks SET deleted=1 WHERE track_id=?", (tid,))
+            self._log(tid, DELETE)
+        return gone
+
+    # Brani vivi nell'ordine del catalogo
+    def records(self, since_pos=0):
+        for (rec,) in self._db.execute("SELECT rec FROM tracks WHERE deleted=0 AND pos>=? ORDER BY pos",
+                                       (since_pos,)):
+            yield json.loads(rec)
+
+    # Feed delle modifiche dopo `since`, per id (stato netto): inserito e poi cancellato → non riportato
+    def changes(self, since=0):
+        first, last = {}, {}
+        for tid, op in self._db.execute("SELECT track_id, op FROM changes WHERE seq>? ORDER BY seq", (since,)):
+            first.setdefault(tid, op); last[tid] = op
+        out = {"since": since, "seq": self.seq(), "inserted": [], "updated": [], "deleted": []}
+        for tid, op in last.items():
+            if op == DELETE:
+                if first[tid] != INSERT: out["deleted"].append(tid)
+            elif first[tid] == INSERT: out["inserted"].append(tid)
+            else: out["updated"].append(tid)
+        return out
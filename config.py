@@ -141,5 +141,43 @@ GENRE_TO_MACROGENRE = {
 
 
 
+# Fetch Spotify: richieste parallele, rate limit condiviso (richieste/s), tentativi per chiamata.
+# SPOTIFY_API_PREFIX punta il client a un server locale che imita l'API (es. http://127.0.0.1:8000/v1/)
+FETCH_CONCURRENCY = int(os.getenv("SPOTIFY_FETCH_CONCURRENCY", "8"))
+FETCH_RATE        = float(os.getenv("SPOTIFY_RATE_LIMIT", "10"))
+FETCH_RETRIES     = int(os.getenv("SPOTIFY_MAX_RETRIES", "5"))
+API_PREFIX        = os.getenv("SPOTIFY_API_PREFIX")
+
+# Cache catalogo (output/catalog_cache.sqlite): playlist più giovani del TTL non vengono
+# nemmeno controllate; CATALOG_CACHE_ONLY=1 → nessuna richiesta di rete, solo cache
+CATALOG_CACHE_TTL  = float(os.getenv("CATALOG_CACHE_TTL_HOURS", "12")) * 3600
+CATALOG_CACHE_ONLY = os.getenv("CATALOG_CACHE_ONLY", "0") == "1"
+
+# Audio feature: backend in ordine di priorità (spotify, local, dump, synthetic), dietro una cache per id
+# (local = analisi dei file audio <track_id>.<ext> in AUDIO_DIR, vedi audio_analysis.py)
+FEATURE_BACKENDS = [b.strip() for b in os.getenv("FEATURE_BACKENDS", "dump,synthetic").split(",") if b.strip()]
+AUDIO_DIR        = os.getenv("AUDIO_DIR", "output/audio")
+
+# Micro-epsilon di tie-break: "fast" (PRNG counter-based) o "blake2b" (valori storici)
+NOISE_MODE = os.getenv("SPINNING_NOISE_MODE", "fast")
+
+# Classe: partecipanti estratti oltre al coach (eventi in studio: 100–500); RATINGS_DUMP=0 → niente
+# voti per partecipante in individual_ratings*.json (restano punteggi e medie)
+CLASS_SIZE   = int(os.getenv("CLASS_SIZE", "10"))
+RATINGS_DUMP = os.getenv("RATINGS_DUMP", "1") == "1"
+# Formato del dump dei voti: json (leggibile) | npz | jsonl.gz (colonnari, vedi ratings_export.py)
+RATINGS_FORMAT = os.getenv("RATINGS_FORMAT", "json")
+
+# Segmenti valutati in parallelo (processi); 1 = in serie. Stesso output in entrambi i casi
+SEGMENT_WORKERS = int(os.getenv("SEGMENT_WORKERS", "1"))
+
+# Cache persistente delle componenti voto persona × brano tra le run (output/rating_cache.sqlite, vedi
+# rating_cache.py): RATING_CACHE=1 la attiva, RATING_CACHE_MB ne limita la dimensione (eviction LRU)
+RATING_CACHE    = os.getenv("RATING_CACHE", "0") == "1"
+RATING_CACHE_MB = float(os.getenv("RATING_CACHE_MB", "1024"))
+
+# Durata della lezione (minuti) per la sessione a tempo di sequencer.py (--session-minutes in main.py)
+SESSION_MINUTES = float(os.getenv("SESSION_MINUTES", "45"))
+
 # Percorso file personas
 PERSONAS_PATH = "profiles/personas.json"
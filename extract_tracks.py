@@ -6,13 +6,15 @@
 import json
 import random
 import re
+import sys
+from itertools import chain
 from pathlib import Path
 
-import pandas as pd
-import spotipy
-from spotipy.oauth2 import SpotifyOAuth
-
 import config
+import profiling
+from features import UNCACHED_SOURCES, FeatureProvider, SyntheticFeatures, with_features
+from genre_ranges import complete_ranges, read_genre_ranges
+from spotify_fetch import fetch_iter
 
 # Config percorsi
 
@@ -20,43 +22,42 @@ FAVORITES_PATH = Path("output/brani_preferiti.json")
 RANGES_CSV     = Path("Feature_Ranges_Espansi.csv")
 OUTPUT_PATH    = Path("output/tracks_by_genre.json")
 
-
-# Autenticazione Spotify
-sp = spotipy.Spotify(auth_manager=SpotifyOAuth(
-    client_id=config.CLIENT_ID,
-    client_secret=config.CLIENT_SECRET,
-    redirect_uri=config.REDIRECT_URI,
-    scope=config.SCOPE
-))
-
-# Carica i range per genere (CSV)
-def _to_pair(s):
-    s = str(s).strip().strip("()").replace(" ", "")
-    a, b = s.split(",")
-    return float(a), float(b)
-
-try:
-    df_ranges = pd.read_csv(RANGES_CSV)
-except Exception as e:
-    raise SystemExit(f"❌ Impossibile leggere {RANGES_CSV}: {e}")
-
-range_dict = {}
-for _, row in df_ranges.iterrows():
-    try:
-        g = row['Genere']
-        range_dict[g] = {
-            'bpm':          _to_pair(row['BPM']),
-            'danceability': _to_pair(row['Danceability']),
-            'valence':      _to_pair(row['Valence']),
-        }
-    except Exception:
-        # Se per un genere manca qualcosa, lo saltiamo
-        continue
+PAGE_SIZE  = 100   # massimo consentito da Spotify per pagina
+PER_PLAYLIST = 20  # brani campionati per playlist (sull'intera playlist)
+
+
+# Autenticazione Spotify (spotipy importato solo qui). Sessione HTTP propria senza retry: quella di
+# spotipy ritenta 429 (con Retry-After, dormendo nel thread del worker) e 5xx anche con retries=0, perché
+# status_forcelist vuoto torna al default. Così 429, 5xx e rete arrivano come eccezioni a spotify_fetch,
+# che applica Retry-After al bucket condiviso.
+def get_client(prefix=config.API_PREFIX, auth_manager=None):
+    import requests
+    import spotipy
+    if auth_manager is None:
+        from spotipy.oauth2 import SpotifyOAuth
+        auth_manager = SpotifyOAuth(
+            client_id=config.CLIENT_ID,
+            client_secret=config.CLIENT_SECRET,
+            redirect_uri=config.REDIRECT_URI,
+            scope=config.SCOPE
+        )
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(max_retries=0, pool_maxsize=max(10, config.FETCH_CONCURRENCY))
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    sp = spotipy.Spotify(auth_manager=auth_manager, requests_session=session)
+    if prefix:
+        sp.prefix = prefix
+    return sp
+
+# Range per genere (CSV) → solo generi con bpm/danceability/valence completi
+def load_ranges(csv_path: Path = RANGES_CSV):
+    ranges = read_genre_ranges(csv_path)
+    if ranges is None:
+        raise SystemExit(f"❌ Impossibile leggere {csv_path}: file non trovato")
+    return complete_ranges(ranges)
 
 # Util
-def generate_feature_value(low, high):
-    return round(random.uniform(low, high), 3)
-
 _BASE62 = re.compile(r'^[A-Za-z0-9]+$')
 def is_valid_playlist_id(pid: str) -> bool:
     return isinstance(pid, str) and len(pid) >= 10 and len(pid) <= 40 and bool(_BASE62.match(pid))
@@ -121,10 +122,6 @@ genre_playlists = {
     "Dance 2000": "0rOqzamDvbFQJHpMBSG843",
 }
 
-# Output containers
-output = []
-seen_ids = set()
-
 # Fase 1 — Aggiunta PREFERITI
 def load_favorites(path: Path):
     if not path.exists():
@@ -136,118 +133,319 @@ def load_favorites(path: Path):
         print(f"❌ Errore nel parsing di {path}: {e}")
         return {}
 
-favorites_map = load_favorites(FAVORITES_PATH)
-
-fav_candidates = []  # (person_name, fav_obj)
-if isinstance(favorites_map, dict):
-    for person, items in favorites_map.items():
-        if not isinstance(items, list) or not items:
-            continue
-        random.shuffle(items)
-        fav_candidates.append((person, items[0]))  # max 1 per persona
-elif isinstance(favorites_map, list):
-    random.shuffle(favorites_map)
-    for fav in favorites_map[:10]:
-        fav_candidates.append(("anon", fav))
-
-random.shuffle(fav_candidates)
-fav_selected = fav_candidates[:10]  # cap 10 totali
-
-added_favs = 0
-fav_added_list = []
-fav_skipped = []
-
-for person, fav in fav_selected:
-    try:
-        title = fav.get("title")
-        artist = fav.get("artist")
-        genre  = fav.get("genre")
-        sid    = fav.get("spotify_id") or fav.get("id")
-
-        if not sid:
-            fav_skipped.append((person, title or "?", "manca spotify_id"))
-            continue
-        if sid in seen_ids:
-            fav_skipped.append((person, title or "?", "duplicato"))
-            continue
-        if genre not in range_dict:
-            fav_skipped.append((person, title or "?", f"genere assente nei range: {genre}"))
-            continue
-
-        features = range_dict[genre]
-        # Preferiti PRIMA e ben marcati
-        output.append({
-            "title": title,
-            "note": f"## BRANO PREFERITO DI {person}",
-            "artist": artist,
-            "genre": genre,
-            "id": sid,
-            "bpm": generate_feature_value(*features["bpm"]),
-            "danceability": generate_feature_value(*features["danceability"]),
-            "valence": generate_feature_value(*features["valence"])
-        })
-        seen_ids.add(sid)
-        fav_added_list.append((person, title or "?", genre))
-        added_favs += 1
-    except Exception as e:
-        fav_skipped.append((person, fav.get("title","?"), f"errore: {e}"))
-
-# Fase 2 — Raccolta dalle PLAYLIS
-for genre, playlists in genre_playlists.items():
-    pl_list = playlists if isinstance(playlists, list) else [playlists]
-
-    for playlist_id in pl_list:
-        if not is_valid_playlist_id(playlist_id):
-            print(f"⚠️  Playlist ID non valido (skip): {playlist_id} (genere: {genre})")
-            continue
-        try:
-            results = sp.playlist_tracks(playlist_id, limit=100)
-            items = results.get('items', []) or []
+def select_favorites(favorites_map):
+    fav_candidates = []  # (person_name, fav_obj)
+    if isinstance(favorites_map, dict):
+        for person, items in favorites_map.items():
+            if not isinstance(items, list) or not items:
+                continue
             random.shuffle(items)
-            selected = items[:20]  # pick fino a 20 per playlist
-
-            for track in selected:
-                try:
-                    t = track.get('track') or {}
-                    tid = t.get('id')
-                    if not tid or tid in seen_ids:
-                        continue
-                    if genre not in range_dict:
-                        continue
-                    features = range_dict[genre]
-
-                    track_info = {
-                        "title": t.get('name'),
-                        "artist": (t.get('artists') or [{}])[0].get('name'),
-                        "genre": genre,
-                        "id": tid,
-                        "bpm": generate_feature_value(*features["bpm"]),
-                        "danceability": generate_feature_value(*features["danceability"]),
-                        "valence": generate_feature_value(*features["valence"]),
-                    }
-                    output.append(track_info)
-                    seen_ids.add(tid)
-                except Exception:
-                    continue
-
+            fav_candidates.append((person, items[0]))  # max 1 per persona
+    elif isinstance(favorites_map, list):
+        random.shuffle(favorites_map)
+        for fav in favorites_map[:10]:
+            fav_candidates.append(("anon", fav))
+
+    random.shuffle(fav_candidates)
+    return fav_candidates[:10]  # cap 10 totali
+
+def add_favorites(output, seen_ids, fav_selected, range_dict):
+    fav_added_list = []
+    fav_skipped = []
+    for person, fav in fav_selected:
+        try:
+            title = fav.get("title")
+            artist = fav.get("artist")
+            genre  = fav.get("genre")
+            sid    = fav.get("spotify_id") or fav.get("id")
+
+            if not sid:
+                fav_skipped.append((person, title or "?", "manca spotify_id"))
+                continue
+            if sid in seen_ids:
+                fav_skipped.append((person, title or "?", "duplicato"))
+                continue
+            if genre not in range_dict:
+                fav_skipped.append((person, title or "?", f"genere assente nei range: {genre}"))
+                continue
+
+            # Preferiti PRIMA e ben marcati (feature risolte poi dal provider)
+            output.append({
+                "title": title,
+                "note": f"## BRANO PREFERITO DI {person}",
+                "artist": artist,
+                "genre": genre,
+                "id": sid,
+            })
+            seen_ids.add(sid)
+            fav_added_list.append((person, title or "?", genre))
         except Exception as e:
-            print(f"❌ Errore nella playlist {playlist_id}: {e}")
-
-# Log finale + salvataggio
-if fav_added_list:
-    print("\n⭐ Preferiti inseriti (in testa al file):")
-    for who, title, genre in fav_added_list:
-        print(f"  - {title}  [{genre}]  — di {who}")
-
-if fav_skipped:
-    print("\nℹ️ Preferiti saltati:")
-    for who, title, reason in fav_skipped:
-        print(f"  - {title} — di {who}  → {reason}")
-
-print(f"\n🎯 Aggiunti {added_favs} brani da brani_preferiti.profiles (max 1 per persona, max 10 totali)")
-print(f"📦 Totale brani raccolti: {len(output)}")
-
-with OUTPUT_PATH.open("w", encoding="utf-8") as f:
-    json.dump(output, f, ensure_ascii=False, indent=2)
-
-print(f"✅ Salvato: {OUTPUT_PATH}")
+            fav_skipped.append((person, fav.get("title","?"), f"errore: {e}"))
+    return fav_added_list, fav_skipped
+
+# Fase 2 — Raccolta dalle PLAYLIST
+# Item compatto (track_id, nome, artista, durata ms); None se manca il brano/id
+def compact_item(item):
+    t = (item or {}).get('track') or {}
+    tid = t.get('id')
+    if not tid:
+        return None
+    return tid, t.get('name'), (t.get('artists') or [{}])[0].get('name'), t.get('duration_ms')
+
+# Pagine della playlist seguite in modo lazy tramite `next` (una richiesta per pagina)
+def playlist_items(sp, playlist_id, call=lambda fn: fn(), page_size=PAGE_SIZE):
+    res = call(lambda: sp.playlist_tracks(playlist_id, limit=page_size))
+    while res:
+        for item in res.get('items', []) or []:
+            it = compact_item(item)
+            if it is not None:
+                yield it
+        res = call(lambda r=res: sp.next(r)) if res.get('next') else None
+
+# Solo lo snapshot_id: richiesta leggera per sapere se la playlist è cambiata
+def playlist_snapshot(sp, playlist_id, call=lambda fn: fn()):
+    return (call(lambda: sp.playlist(playlist_id, fields="snapshot_id")) or {}).get('snapshot_id')
+
+# Passa gli item e ne annota gli id (composizione completa della playlist, per i tombstone)
+def _tee_ids(items, ids):
+    for it in items:
+        ids.add(it[0])
+        yield it
+
+# Campione uniforme di k elementi da uno stream di lunghezza ignota (algoritmo R):
+# in memoria resta solo il campione, restituito in ordine casuale
+def reservoir_sample(items, k, rng=random):
+    sample = []
+    for n, x in enumerate(items):
+        if n < k:
+            sample.append(x)
+        else:
+            j = rng.randrange(n+1)
+            if j < k:
+                sample[j] = x
+    rng.shuffle(sample)
+    return sample
+
+# Le playlist sono lette in parallelo (spotify_fetch), ognuna con un RNG derivato da
+# `random` nell'ordine del dizionario; i record escono nello stesso ordine, appena pronti,
+# quindi il catalogo è riproducibile a parità di seed.
+# Con `cache` (CatalogCache) gli item arrivano dalla cache se la playlist non è cambiata;
+# `offline` → solo cache, nessuna richiesta.
+# Con `members` (dict) vi finiscono gli id di tutte le playlist lette senza errori e con `sources`
+# (dict) la playlist di ogni brano emesso: servono al merge incrementale (refresh_catalog).
+def iter_playlist_tracks(sp, seen_ids, range_dict, playlists_by_genre=None,
+                         concurrency=None, per_playlist=PER_PLAYLIST, cache=None, offline=False,
+                         members=None, sources=None):
+    jobs = []
+    for genre, playlists in (playlists_by_genre or genre_playlists).items():
+        pl_list = playlists if isinstance(playlists, list) else [playlists]
+        for playlist_id in pl_list:
+            if not is_valid_playlist_id(playlist_id):
+                print(f"⚠️  Playlist ID non valido (skip): {playlist_id} (genere: {genre})")
+                continue
+            jobs.append((len(jobs), genre, playlist_id, random.getrandbits(64)))
+
+    # Una voce di profilo per playlist (nei worker: solo tempi, niente tracemalloc)
+    def sample(job, call):
+        _, genre, playlist_id, seed = job
+        rng = random.Random(seed)
+        ids = None if members is None else set()
+        with profiling.stage("playlist_fetch", genre=genre, playlist=playlist_id) as s:
+            if cache is None:
+                items = playlist_items(sp, playlist_id, call)
+                status, selected = None, reservoir_sample(items if ids is None else _tee_ids(items, ids),
+                                                          per_playlist, rng)
+            else:
+                status, items = cache.playlist(playlist_id,
+                                               snapshot=lambda: playlist_snapshot(sp, playlist_id, call),
+                                               fetch=lambda: playlist_items(sp, playlist_id, call),
+                                               offline=offline)
+                if ids is not None: ids.update(it[0] for it in items)
+                selected = reservoir_sample(items, per_playlist, rng)
+                s.add(**{status: 1})
+            s.add(sampled=len(selected))
+        return status, selected, ids
+
+    kw = {} if concurrency is None else {"concurrency": concurrency}
+    stats = {}
+    for (_, genre, playlist_id, _), res, err in fetch_iter(sample, jobs, **kw):
+        if err is not None:
+            print(f"❌ Errore nella playlist {playlist_id}: {err}")
+            continue
+        status, selected, ids = res
+        stats[status] = stats.get(status, 0) + 1
+        if members is not None: members[playlist_id] = members.get(playlist_id, set()) | ids
+        for tid, name, artist, duration_ms in selected:
+            if tid in seen_ids or genre not in range_dict:
+                continue
+            if sources is not None: sources[tid] = playlist_id
+            yield {
+                "title": name,
+                "artist": artist,
+                "genre": genre,
+                "id": tid,
+                "duration_ms": duration_ms,
+            }
+            seen_ids.add(tid)
+
+    if cache is not None:
+        print("\n🗄️  Cache playlist: " + ", ".join(f"{n} {k}" for k, n in sorted(stats.items())))
+
+# Catalogo in streaming: preferiti in testa, poi playlist (dedup per id); log a fine stream.
+# Le feature arrivano dal provider a blocchi (default: solo sintetiche, come in origine).
+def iter_catalog(sp, range_dict, favorites_path: Path = FAVORITES_PATH, cache=None, offline=False,
+                 features=None):
+    provider = features or FeatureProvider([SyntheticFeatures(range_dict)])
+    fav_head = []
+    seen_ids = set()
+
+    with profiling.stage("favorites_merge") as s:
+        fav_selected = select_favorites(load_favorites(favorites_path))
+        fav_added_list, fav_skipped = add_favorites(fav_head, seen_ids, fav_selected, range_dict)
+        s.add(selected=len(fav_selected), added=len(fav_added_list), skipped=len(fav_skipped))
+    total = 0
+    records = chain(fav_head, iter_playlist_tracks(sp, seen_ids, range_dict, cache=cache, offline=offline))
+    for rec in with_features(records, provider):
+        total += 1
+        yield rec
+
+    # Log finale
+    if fav_added_list:
+        print("\n⭐ Preferiti inseriti (in testa al file):")
+        for who, title, genre in fav_added_list:
+            print(f"  - {title}  [{genre}]  — di {who}")
+
+    if fav_skipped:
+        print("\nℹ️ Preferiti saltati:")
+        for who, title, reason in fav_skipped:
+            print(f"  - {title} — di {who}  → {reason}")
+
+    print(f"\n🎯 Aggiunti {len(fav_added_list)} brani da brani_preferiti.profiles (max 1 per persona, max 10 totali)")
+    print(f"🎛️  Feature: " + ", ".join(f"{n} {k}" for k, n in provider.stats.items()))
+    print(f"📦 Totale brani raccolti: {total}")
+
+# Catalogo completo in memoria (per il ranking nello stesso processo)
+def build_catalog(sp, range_dict, favorites_path: Path = FAVORITES_PATH, cache=None, offline=False,
+                  features=None):
+    return list(iter_catalog(sp, range_dict, favorites_path, cache, offline, features))
+
+# Scrittura in streaming, stesso formato di json.dump(indent=2); file temporaneo + rename
+def save_catalog(records, path: Path = OUTPUT_PATH):
+    path = Path(path)
+    tmp = path.with_name(path.name + ".tmp")
+    # In streaming (records generatore) il tempo include la produzione: vedi gli stadi figli
+    with profiling.stage("json_export", file=path.name) as s, tmp.open("w", encoding="utf-8") as f:
+        sep = "[\n  "
+        for rec in records:
+            f.write(sep + json.dumps(rec, ensure_ascii=False, indent=2).replace("\n", "\n  "))
+            sep = ",\n  "
+            s.add(items=1)
+        f.write("[]" if sep.startswith("[") else "\n]")
+    tmp.replace(path)
+    print(f"✅ Salvato: {path}")
+
+# In coda a un file scritto da save_catalog, senza riscriverlo: il risultato è identico a
+# save_catalog(vecchi + nuovi). Il file va lasciato com'è tra le run (lo controlla refresh_catalog).
+def append_catalog(records, path: Path = OUTPUT_PATH):
+    path = Path(path)
+    n = 0
+    with profiling.stage("json_export", file=path.name, mode="append") as s, path.open("r+b") as f:
+        end = f.seek(0, 2)
+        f.seek(max(0, end-2))
+        tail = f.read()
+        if tail not in (b"[]", b"\n]"):
+            raise ValueError(f"{path}: fine file inattesa, non scritto da save_catalog")
+        f.seek(end-2)
+        sep = "[\n  " if tail == b"[]" else ",\n  "
+        for rec in records:
+            f.write((sep + json.dumps(rec, ensure_ascii=False, indent=2).replace("\n", "\n  ")).encode("utf-8"))
+            sep = ",\n  "
+            n += 1
+        f.write(b"[]" if sep.startswith("[") else b"\n]")
+        f.truncate()
+        s.add(items=n)
+    print(f"✅ Aggiunti {n} brani in coda: {path}")
+
+# Aggiornamento incrementale del catalogo sull'indice persistente (catalog_index.py):
+#   brani nuovi → feature dal provider e insert in coda; brani già noti (anche tombstone) → feature
+#   salvate, solo titolo/artista/nota aggiornati; brani non più in nessuna delle loro playlist → tombstone.
+#   Le feature salvate provvisorie (sintetiche o di origine ignota) ripassano dal provider a ogni run:
+#   le sostituisce il primo backend reale che le risolve, altrimenti restano quelle salvate.
+# Il JSON in `path` è aggiornato in coda se ci sono solo insert nuovi, altrimenti riscritto
+# dall'indice; il feed della run (id inseriti/aggiornati/rimossi) va in <path>.changes.json.
+# Restituisce (brani vivi, feed).
+def refresh_catalog(sp, range_dict, index, path: Path = OUTPUT_PATH, favorites_path: Path = FAVORITES_PATH,
+                    cache=None, offline=False, features=None):
+    path = Path(path)
+    provider = features or FeatureProvider([SyntheticFeatures(range_dict)])
+    since, start = index.seq(), index.next_pos
+    if since == 0 and len(index) == 0 and path.exists():   # primo merge: parte dal catalogo esistente
+        with profiling.stage("catalog_import") as s:
+            for rec in json.loads(path.read_text(encoding="utf-8")):
+                if index.get(rec.get("id")) is None: index.insert(rec); s.add(items=1)
+        index.set_meta("exported_seq", index.seq())
+        since, start = index.seq(), index.next_pos
+
+    members, sources, seen_ids, fav_head = {}, {}, set(), []
+    with profiling.stage("favorites_merge") as s:
+        fav_selected = select_favorites(load_favorites(favorites_path))
+        fav_added_list, fav_skipped = add_favorites(fav_head, seen_ids, fav_selected, range_dict)
+        s.add(selected=len(fav_selected), added=len(fav_added_list), skipped=len(fav_skipped))
+    records = chain(fav_head, iter_playlist_tracks(sp, seen_ids, range_dict, cache=cache, offline=offline,
+                                                   members=members, sources=sources))
+    counts = {"insert": 0, "update": 0, "delete": 0, "revive": 0}
+    def merge(rec, source=None):
+        op = index.merge(rec, sources.get(rec["id"]), source)
+        if op == "insert": counts["revive"] += 1
+        elif op == "update": counts["update"] += 1
+    def unresolved(recs):   # i brani già nell'indice con feature definitive non passano dal provider
+        for rec in recs:
+            if index.get(rec["id"]) is None or index.source(rec["id"]) in (None, *UNCACHED_SOURCES):
+                yield rec
+            else:
+                merge(rec)
+    feat_src = {}
+    with profiling.stage("catalog_merge") as s:
+        for rec in with_features(unresolved(records), provider, sources=feat_src):
+            src = feat_src.get(rec["id"])
+            if index.get(rec["id"]) is None:
+                index.insert(rec, sources.get(rec["id"]), src); counts["insert"] += 1
+            else:
+                merge(rec, None if src in UNCACHED_SOURCES else src)
+        counts["delete"] = len(index.tombstone_missing(members))
+        s.add(**counts)
+
+    feed = index.changes(since)
+    only_new = not (counts["update"] or counts["delete"] or counts["revive"])
+    if only_new and path.exists() and index.meta("exported_seq") == since:
+        append_catalog(index.records(start), path)
+    else:
+        save_catalog(index.records(), path)
+    index.set_meta("exported_seq", index.seq())
+    index.commit()
+    changes_path = path.with_name(path.stem + ".changes.json")
+    changes_path.write_text(json.dumps(feed, ensure_ascii=False, indent=2), encoding="utf-8")
+
+    print(f"\n🎯 Aggiunti {len(fav_added_list)} brani da brani_preferiti.profiles (max 1 per persona, max 10 totali)")
+    print(f"🎛️  Feature: " + ", ".join(f"{n} {k}" for k, n in provider.stats.items()))
+    print(f"🔄 Merge catalogo: {counts['insert']} nuovi, {counts['revive']} ripristinati, "
+          f"{counts['update']} aggiornati, {counts['delete']} rimossi (tombstone) → {len(index)} brani; "
+          f"feed in {changes_path}")
+    return list(index.records()), feed
+
+if __name__ == "__main__":
+    from catalog_cache import CatalogCache
+    profiling.from_argv(sys.argv, "output/profile_extract_tracks.json")
+    from features import FeatureCache, default_provider
+    offline = config.CATALOG_CACHE_ONLY or "--offline" in sys.argv
+    sp = None if offline else get_client()
+    range_dict = load_ranges()
+    with CatalogCache() as cache, FeatureCache() as fcache:
+        if "--merge" in sys.argv:
+            from catalog_index import CatalogIndex
+            with CatalogIndex() as index:
+                refresh_catalog(sp, range_dict, index, cache=cache, offline=offline,
+                                features=default_provider(sp, range_dict, fcache))
+        else:
+            save_catalog(iter_catalog(sp, range_dict, cache=cache, offline=offline,
+                                      features=default_provider(sp, range_dict, fcache)))
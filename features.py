@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+   features.py — provider delle audio feature (bpm, danceability, valence) per brano
+"""
+
+import csv
+import json
+import random
+import sqlite3
+import threading
+from pathlib import Path
+
+import profiling
+from config import FEATURE_BACKENDS
+from spotify_fetch import fetch_all
+
+FEATURES = ("bpm", "danceability", "valence")
+BATCH_SIZE = 100   # id per richiesta audio-features (limite Spotify)
+
+# Valori di ripiego, non definitivi: mai letti né scritti in cache, così un backend reale
+# configurato più avanti (dump, spotify, local) li sostituisce alla risoluzione successiva
+UNCACHED_SOURCES = ("synthetic",)
+
+FEATURE_CACHE_PATH = Path("output/feature_cache.sqlite")
+FEATURE_DUMP_PATH  = Path("output/audio_features.json")
+
+def _feat(bpm, dance, valence):
+    r = lambda x: None if x is None else round(float(x), 3)
+    return {"bpm": r(bpm), "danceability": r(dance), "valence": r(valence)}
+
+# Backend: ogni lookup(tracks) riceve [(track_id, genere)] e restituisce {track_id: feature}
+# solo per i brani che sa risolvere; i mancanti passano al backend successivo.
+
+# Audio-features Spotify, fino a 100 id per chiamata (batch in parallelo con rate limit condiviso).
+# Un 401/403 (endpoint non disponibile per l'app) disattiva il backend per il resto del run.
+class SpotifyFeatures:
+    name = "spotify"
+
+    def __init__(self, sp, batch=BATCH_SIZE):
+        self.sp, self.batch = sp, batch
+        self.enabled = sp is not None
+
+    def lookup(self, tracks):
+        if not self.enabled or not tracks:
+            return {}
+        ids = [tid for tid, _ in tracks]
+        chunks = [tuple(ids[i:i+self.batch]) for i in range(0, len(ids), self.batch)]
+        out = {}
+        for _, res, err in fetch_all(lambda c, call: call(lambda: self.sp.audio_features(list(c))), chunks):
+            if err is not None:
+                if getattr(err, "http_status", None) in (401, 403):
+                    print(f"⚠️  Audio features Spotify non disponibili ({err.http_status}): backend disattivato")
+                    self.enabled = False
+                    return out
+                print(f"❌ Errore audio features: {err}")
+                continue
+            for f in res or []:
+                if f and f.get("id"):
+                    out[f["id"]] = _feat(f.get("tempo"), f.get("danceability"), f.get("valence"))
+        return out
+
+# Dump locale: JSON {id: {...}} o lista di record con "id", oppure CSV con colonna id.
+# Il BPM può chiamarsi "bpm" o "tempo" (formato audio-features).
+class DumpFeatures:
+    name = "dump"
+
+    def __init__(self, path=FEATURE_DUMP_PATH):
+        self.path = Path(path)
+        self._data = None
+
+    def _load(self):
+        if not self.path.exists():
+            return {}
+        if self.path.suffix.lower() == ".csv":
+            with self.path.open(encoding="utf-8", newline="") as f:
+                rows = list(csv.DictReader(f))
+        else:
+            rows = json.loads(self.path.read_text(encoding="utf-8"))
+            if isinstance(rows, dict):
+                rows = [{"id": k, **v} for k, v in rows.items()]
+        num = lambda x: None if x in (None, "") else float(x)
+        return {str(r["id"]): _feat(num(r.get("bpm", r.get("tempo"))), num(r.get("danceability")), num(r.get("valence")))
+                for r in rows if r.get("id")}
+
+    def lookup(self, tracks):
+        if self._data is None:
+            self._data = self._load()
+        return {tid: self._data[tid] for tid, _ in tracks if tid in self._data}
+
+# Fallback sintetico (comportamento storico): valori uniformi nei range del genere (CSV)
+class SyntheticFeatures:
+    name = "synthetic"
+
+    def __init__(self, range_dict, rng=random):
+        self.range_dict, self.rng = range_dict, rng
+
+    def lookup(self, tracks):
+        out = {}
+        for tid, genre in tracks:
+            r = self.range_dict.get(genre)
+            if r is None:
+                continue
+            out[tid] = _feat(*(self.rng.uniform(*r[k]) for k in FEATURES))
+        return out
+
+# Cache persistente per track id (SQLite): ogni brano è risolto una volta sola (tranne UNCACHED_SOURCES)
+class FeatureCache:
+    def __init__(self, path=FEATURE_CACHE_PATH):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS features (track_id TEXT PRIMARY KEY, "
+                         "bpm REAL, danceability REAL, valence REAL, source TEXT)")
+
+    def close(self):
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # {track_id: feature}; se `sources` è un dict vi annota il backend che aveva risolto ogni id
+    def get_many(self, ids, sources=None):
+        out = {}
+        ids = list(ids)
+        with self._lock:
+            for i in range(0, len(ids), 500):  # limite parametri SQLite
+                chunk = ids[i:i+500]
+                q = (f"SELECT track_id, bpm, danceability, valence, source FROM features WHERE track_id IN "
+                     f"({','.join('?'*len(chunk))}) AND source NOT IN ({','.join('?'*len(UNCACHED_SOURCES))})")
+                for tid, b, d, v, src in self._db.execute(q, chunk + list(UNCACHED_SOURCES)):
+                    out[tid] = {"bpm": b, "danceability": d, "valence": v}
+                    if sources is not None: sources[tid] = src
+        return out
+
+    def put_many(self, feats, source):
+        rows = [(tid, f["bpm"], f["danceability"], f["valence"], source) for tid, f in feats.items()]
+        with self._lock, self._db:
+            self._db.executemany("INSERT OR REPLACE INTO features VALUES (?,?,?,?,?)", rows)
+
+# Catena di backend dietro la cache: cache → backend[0] → backend[1] → ...
+class FeatureProvider:
+    def __init__(self, backends, cache=None):
+        self.backends, self.cache = list(backends), cache
+        self.stats = {}
+
+    def _count(self, key, n):
+        if n: self.stats[key] = self.stats.get(key, 0) + n
+
+    # {track_id: feature}; `sources` (dict, opzionale) riceve il backend di ogni id risolto
+    def resolve(self, tracks, sources=None):
+        tracks = list(dict(tracks).items())  # dedup per id, ordine preservato
+        out = self.cache.get_many((tid for tid, _ in tracks), sources) if self.cache is not None else {}
+        self._count("cache", len(out))
+        todo = [(tid, g) for tid, g in tracks if tid not in out]
+        for b in self.backends:
+            if not todo: break
+            found = b.lookup(todo)
+            if self.cache is not None and found and b.name not in UNCACHED_SOURCES:
+                self.cache.put_many(found, b.name)
+            self._count(b.name, len(found))
+            out.update(found)
+            if sources is not None: sources.update(dict.fromkeys(found, b.name))
+            todo = [(tid, g) for tid, g in todo if tid not in found]
+        return out
+
+def _local_backend():
+    from audio_analysis import LocalAudioFeatures  # import pigro: serve solo con il backend "local"
+    return LocalAudioFeatures()
+
+def make_backends(names, sp=None, range_dict=None, dump_path=FEATURE_DUMP_PATH):
+    factories = {
+        "spotify":   lambda: SpotifyFeatures(sp),
+        "local":     _local_backend,
+        "dump":      lambda: DumpFeatures(dump_path),
+        "synthetic": lambda: SyntheticFeatures(range_dict or {}),
+    }
+    unknown = [n for n in names if n not in factories]
+    if unknown:
+        raise ValueError(f"Backend feature sconosciuti: {', '.join(unknown)} (attesi: {', '.join(factories)})")
+    return [factories[n]() for n in names]
+
+def default_provider(sp=None, range_dict=None, cache=None, names=FEATURE_BACKENDS):
+    return FeatureProvider(make_backends(names, sp, range_dict), cache)
+
+# Completa i record in streaming a blocchi di `batch` (una risoluzione per blocco, ordine invariato).
+# `sources` come in FeatureProvider.resolve: chi salva i record sa quali feature sono solo di ripiego
+def with_features(records, provider, batch=BATCH_SIZE, sources=None):
+    buf = []
+    def flush():
+        with profiling.stage("feature_resolve") as s:
+            feats = provider.resolve([(r["id"], r.get("genre")) for r in buf], sources)
+            s.add(tracks=len(buf))
+        for r in buf:
+            r.update(feats.get(r["id"]) or dict.fromkeys(FEATURES))
+        return buf
+    for rec in records:
+        buf.append(rec)
+        if len(buf) >= batch:
+            yield from flush()
+            buf = []
+    if buf:
+        yield from flush()
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+   genre_ranges.py — lettura dei range per genere (Feature_Ranges_Espansi.csv), solo stdlib
+"""
+
+import ast
+import csv
+from pathlib import Path
+
+FEATURE_RANGES_CSV = Path("Feature_Ranges_Espansi.csv")
+FEATURE_KEYS = ("bpm", "danceability", "valence")
+
+def _pair_tuple(s):
+    try:
+        a,b = ast.literal_eval(str(s)); a,b = float(a),float(b)
+        return (a,b) if a<=b else (b,a)
+    except:
+        return (None,None)
+
+def _pick(x):
+    try: return float(x) if x not in (None,"") else None
+    except: return None
+
+# Range per genere dal CSV: {genere: {"bpm":(min,max), "danceability":(..), "valence":(..)}}
+# Colonne "(min, max)" (BPM/Danceability/Valence) oppure *_min / *_max; None se il file manca.
+def read_genre_ranges(csv_path: Path = FEATURE_RANGES_CSV):
+    csv_path = Path(csv_path)
+    if not csv_path.exists():
+        return None
+    ranges = {}
+    with csv_path.open(newline="",encoding="utf-8") as f:
+        for row in csv.DictReader(f, delimiter=","):
+            g = (row.get("Genere") or row.get("genere") or row.get("genre") or "").strip()
+            if not g: continue
+            if row.get("BPM") and row.get("Danceability") and row.get("Valence"):
+                bpm, d, v = (_pair_tuple(row.get(k)) for k in ("BPM", "Danceability", "Valence"))
+            else:
+                bpm = _pick(row.get("bpm_min")), _pick(row.get("bpm_max"))
+                d   = _pick(row.get("dance_min")), _pick(row.get("dance_max"))
+                v   = _pick(row.get("valence_min")), _pick(row.get("valence_max"))
+            ranges[g] = {"bpm":bpm, "danceability":d, "valence":v}
+    return ranges
+
+# Solo i generi con tutti e tre i range completi (per generare/validare feature)
+def complete_ranges(ranges):
+    return {g: r for g, r in (ranges or {}).items()
+            if all(None not in r[k] for k in FEATURE_KEYS)}
@@ -1,11 +1,14 @@
 #!/usr/bin/env python3
-import sys, runpy, random
+import argparse, random
 from pathlib import Path
 from dotenv import load_dotenv
-from pathlib import Path
 
 load_dotenv(dotenv_path=Path(".") / ".env")  # carica le variabili da .env
 
+import config
+import profiling
+from genre_ranges import complete_ranges, read_genre_ranges
+
 ROOT = Path(__file__).resolve().parent
 OUT  = ROOT / "output"
 PROF = ROOT / "profiles"
@@ -16,12 +19,6 @@ REQUIRED = {
     "coach": PROF / "istruttore.json",
 }
 
-SCRIPTS = [
-    "extract_tracks.py",    # genera output/tracks_by_genre.json
-    "rank_playlist.py",     # modalità “classe” (AWM-majority)
-    "rank_instructor.py",   # modalità “istruttore” (MRP + AWM)
-]
-
 def ensure_layout():
     OUT.mkdir(parents=True, exist_ok=True)
     PROF.mkdir(parents=True, exist_ok=True)
@@ -29,22 +26,178 @@ def ensure_layout():
     if missing:
         raise SystemExit(f"⚠️  Mancano risorse: {', '.join(missing)}. Attesi in {ROOT}")
 
-def run_script(path, seed=None):
-    argv_backup = sys.argv[:]
-    try:
-        sys.argv = [path]
-        if seed is not None:
-            sys.argv += ["--seed", str(seed)]
-        runpy.run_path(str(ROOT / path), run_name="__main__")
-    finally:
-        sys.argv = argv_backup
+# Fasi della pipeline: ognuna riceve il contesto con i risultati delle dipendenze.
+# ranking (e con lui numpy, ~90 ms) è importato nelle fasi: --help e parsing degli argomenti restano leggeri
+def stage_ranges(ctx):
+    return read_genre_ranges(REQUIRED["csv"])
+
+def stage_tolerances(ctx):
+    import ranking
+    return ranking.tolerances_from_ranges(ctx["ranges"])
+
+def stage_catalog(ctx):
+    import ranking
+    if ctx["args"].catalog:
+        return ranking.jload(ctx["args"].catalog)
+    import extract_tracks
+    from catalog_cache import CatalogCache
+    from features import FeatureCache, default_provider
+    offline = ctx["args"].offline
+    sp = None if offline else extract_tracks.get_client()
+    range_dict = complete_ranges(ctx["ranges"])
+    with CatalogCache(OUT / "catalog_cache.sqlite") as cache, FeatureCache(OUT / "feature_cache.sqlite") as fcache:
+        if ctx["args"].merge:   # aggiornamento incrementale: il JSON è già scritto qui
+            from catalog_index import CatalogIndex
+            with CatalogIndex(OUT / "catalog_index.sqlite") as index:
+                records, _ = extract_tracks.refresh_catalog(sp, range_dict, index, OUT / "tracks_by_genre.json",
+                                                            cache=cache, offline=offline,
+                                                            features=default_provider(sp, range_dict, fcache))
+            return records
+        return extract_tracks.build_catalog(sp, range_dict, cache=cache, offline=offline,
+                                            features=default_provider(sp, range_dict, fcache))
+
+def stage_personas(ctx):
+    import ranking
+    return ranking.jload(REQUIRED["personas"])
+
+def stage_coach(ctx):
+    import ranking
+    return ranking.jload(REQUIRED["coach"])
+
+def stage_class(ctx):
+    import ranking
+    personas = ranking.sample_class(ctx["coach"], ctx["personas"], ctx["args"].participants)
+    names = [p.get("nome",f"p{i}") for i,p in enumerate(personas)]
+    print(f"\n👤 Coach: {names[0]}  |  Partecipanti ({len(names)-1}): {ranking.names_label(names[1:])}")
+    return personas
+
+def stage_ranking(ctx):
+    import ranking
+    return ranking.run_full(ctx["catalog"], ctx["class"], aggregators=("awm","mrp"),
+                            coach=True, tolerances=ctx["tolerances"])
+
+# Sink opzionali su disco
+def sink_catalog(ctx):
+    if ctx["args"].merge and not ctx["args"].catalog:
+        return   # già aggiornato in coda da refresh_catalog
+    import extract_tracks
+    extract_tracks.save_catalog(ctx["catalog"], OUT / "tracks_by_genre.json")
+
+def sink_ranking(ctx):
+    import ranking
+    names = [p.get("nome",f"p{i}") for i,p in enumerate(ctx["class"])]
+    ranking.write_class_outputs(ctx["ranking"]["awm"], names[1:],
+                                OUT / "ranking_class.json", OUT / "individual_ratings.json")
+    ranking.write_instructor_outputs(ctx["ranking"]["mrp"], names,
+                                     OUT / "ranking_instructor.json", OUT / "individual_ratings_instructor.json")
+
+def sink_session(ctx):
+    import sequencer
+    minutes = ctx["args"].session_minutes
+    sequencer.write_session(ctx["ranking"]["awm"], OUT / "session_class.json", minutes)
+    sequencer.write_session(ctx["ranking"]["mrp"], OUT / "session_instructor.json", minutes)
+
+# DAG: nome → (dipendenze, funzione)
+STAGES = {
+    "ranges":     ((), stage_ranges),
+    "tolerances": (("ranges",), stage_tolerances),
+    "catalog":    (("ranges",), stage_catalog),
+    "personas":   ((), stage_personas),
+    "coach":      ((), stage_coach),
+    "class":      (("personas", "coach"), stage_class),
+    "ranking":    (("catalog", "tolerances", "class"), stage_ranking),
+}
+SINKS = {
+    "catalog": (("catalog",), sink_catalog),
+    "ranking": (("ranking", "class"), sink_ranking),
+    "session": (("ranking",), sink_session),
+}
+
+def resolve(name, ctx, stages=STAGES):
+    if name in ctx: return ctx[name]
+    deps, fn = stages[name]
+    for d in deps: resolve(d, ctx, stages)
+    print(f"\n▶ {name}")
+    with profiling.stage(f"pipeline.{name}"):
+        ctx[name] = fn(ctx)
+    return ctx[name]
+
+def run_pipeline(args, sinks):
+    ctx = {"args": args}
+    resolve("ranking", ctx)
+    for s in sinks:
+        deps, fn = SINKS[s]
+        for d in deps: resolve(d, ctx)
+        with profiling.stage(f"sink.{s}"):
+            fn(ctx)
+    return ctx
+
+# Batch: range, catalogo e personas risolti una volta, poi una classe per lezione del calendario
+def run_batch_pipeline(args, sinks):
+    import batch
+    ctx = {"args": args}
+    for d in ("ranges", "catalog", "personas"): resolve(d, ctx)
+    for s in sinks:
+        if s in ("ranking", "session"): continue   # scritti per lezione in output/runs/<class_id>/
+        with profiling.stage(f"sink.{s}"):
+            SINKS[s][1](ctx)
+    jobs = batch.load_schedule(args.schedule, ctx["personas"], REQUIRED["coach"])
+    done = batch.run_batch(jobs, ctx["catalog"], ctx["ranges"], ctx["personas"], OUT / "runs", args.workers)
+    if len(done) < len(jobs): raise SystemExit(f"❌ {len(jobs)-len(done)} lezioni fallite")
+    return ctx
 
 def main():
+    ap = argparse.ArgumentParser(description="Pipeline completa: estrazione tracce, calcolo punteggi, generazione playlist.")
+    ap.add_argument("--seed", type=int, default=None, help="Seed per riproducibilità (es. 42)")
+    ap.add_argument("--catalog", type=Path, default=None,
+                    help="Usa un catalogo JSON esistente invece di estrarre da Spotify")
+    ap.add_argument("--offline", action="store_true", default=config.CATALOG_CACHE_ONLY,
+                    help="Catalogo solo dalla cache locale delle playlist, nessuna richiesta a Spotify")
+    ap.add_argument("--sinks", default=None,
+                    help=f"Scritture su disco, separate da virgola ({', '.join(SINKS)}); '' per nessuna")
+    ap.add_argument("--merge", action="store_true",
+                    help="Catalogo incrementale: nuovi brani in coda, rimossi in tombstone, feed delle modifiche")
+    ap.add_argument("--participants", type=int, default=config.CLASS_SIZE,
+                    help=f"Partecipanti estratti oltre al coach (default CLASS_SIZE={config.CLASS_SIZE})")
+    ap.add_argument("--no-ratings", action="store_true", default=not config.RATINGS_DUMP,
+                    help="Niente voti per partecipante nei dump individual_ratings*.json")
+    ap.add_argument("--schedule", type=Path, default=None,
+                    help="Calendario JSON di lezioni (vedi batch.py): output per lezione in output/runs/")
+    ap.add_argument("--workers", type=int, default=None, help="Processi per --schedule (default: uno per core)")
+    ap.add_argument("--ratings-format", choices=("json", "npz", "jsonl.gz"), default=config.RATINGS_FORMAT,
+                    help="Dump dei voti: json leggibile o colonnare (npz, jsonl.gz)")
+    ap.add_argument("--segment-workers", type=int, default=config.SEGMENT_WORKERS,
+                    help="Segmenti valutati in parallelo (processi); stesso output della versione in serie")
+    ap.add_argument("--rating-cache", action="store_true", default=config.RATING_CACHE,
+                    help="Riusa tra le run le componenti voto persona × brano (output/rating_cache.sqlite)")
+    ap.add_argument("--session-minutes", type=float, default=config.SESSION_MINUTES,
+                    help="Durata della sessione a tempo in minuti (sink session)")
+    ap.add_argument("--profile", nargs="?", const=OUT / "profile_main.json", default=None, type=Path,
+                    help="Trace JSON per stadio/segmento: wall, CPU, picco memoria, conteggi")
+    ap.add_argument("--profile-stage", default=None,
+                    help="Dump cProfile (.prof accanto alla trace) di un solo stadio, es. rating")
+    args = ap.parse_args()
+
     ensure_layout()
-    seed = None  # metti un intero per riproducibilità (es. 42)
-    for s in SCRIPTS:
-        print(f"\n▶ {s}")
-        run_script(s, seed=seed)
+    import ranking
+    ranking.DUMP_RATINGS, ranking.SEG_WORKERS = not args.no_ratings, args.segment_workers
+    ranking.RATINGS_FMT, ranking.USE_RATING_CACHE = args.ratings_format, args.rating_cache
+    if args.profile: profiling.enable(args.profile, args.profile_stage)
+    if args.seed is None:
+        random.seed()
+    else:
+        random.seed(args.seed)
+        print(f"🔁 Seed riproducibile: {args.seed}")
+
+    if args.sinks is None:  # default: catalogo solo se estratto ora, ranking e sessione sempre
+        sinks = ["ranking", "session"] if args.catalog else ["catalog", "ranking", "session"]
+    else:
+        sinks = [s.strip() for s in args.sinks.split(",") if s.strip()]
+        unknown = [s for s in sinks if s not in SINKS]
+        if unknown: raise SystemExit(f"❌ Sink sconosciuti: {', '.join(unknown)}")
+
+    if args.schedule: run_batch_pipeline(args, sinks)
+    else: run_pipeline(args, sinks)
     print("\n✅ Pipeline terminata.")
 
 if __name__ == "__main__":
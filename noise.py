@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+   noise.py — micro-epsilon deterministici (tie-break) generati in blocco
+"""
+
+import hashlib
+import numpy as np
+from config import NOISE_MODE
+
+# Modalità:
+#   "fast"    → PRNG counter-based (splitmix64) su chiavi intere stabili: un solo
+#               blake2b per id distinto (cache), poi solo aritmetica su uint64
+#   "blake2b" → compatibilità: stessi valori bit-per-bit della versione storica
+MODES = ("fast", "blake2b")
+_mode = NOISE_MODE if NOISE_MODE in MODES else "fast"
+
+_MASK = (1 << 64) - 1
+_KEYS = {}     # stringa → chiave uint64 (per catalogo/classe: id brano, nome persona, tag)
+_COMPAT = {}   # chiave testuale → epsilon (solo modalità blake2b)
+
+def set_mode(mode):
+    global _mode
+    if mode not in MODES:
+        raise ValueError(f"Modalità noise sconosciuta: {mode} (attese: {', '.join(MODES)})")
+    _mode = mode
+
+def get_mode():
+    return _mode
+
+def clear_cache():
+    _KEYS.clear(); _COMPAT.clear()
+
+# micro-epsilon deterministico (versione storica, una chiave alla volta)
+def _hash_float(key: str, scale: float) -> float:
+    h = hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest()
+    x = int.from_bytes(h,'big') / float(1<<64)  # [0,1)
+    return (x*2.0 - 1.0) * scale
+
+def _compat(key):
+    v = _COMPAT.get(key)
+    if v is None:
+        v = _COMPAT[key] = _hash_float(key, 1.0)
+    return v
+
+def _key(s):
+    k = _KEYS.get(s)
+    if k is None:
+        k = _KEYS[s] = int.from_bytes(hashlib.blake2b(s.encode('utf-8'), digest_size=8).digest(), 'big')
+    return k
+
+def _keys(strs):
+    return np.array([_key(str(s)) for s in strs], dtype=np.uint64)
+
+# splitmix64 (finalizer): versione int Python e versione array uint64, stessi risultati
+def _mix(z):
+    z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & _MASK
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & _MASK
+    return z ^ (z >> 31)
+
+def _mix_np(z):
+    with np.errstate(over="ignore"):
+        z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+def _to_eps(h, scale):
+    u = (h >> np.uint64(11)).astype(np.float64) * (1.0 / (1 << 53))  # [0,1)
+    return (u*2.0 - 1.0) * scale
+
+# Epsilon scalare per la chiave "tag|p1|p2|..."
+def eps(tag, *parts, scale):
+    if _mode == "blake2b":
+        return _compat("|".join([tag, *map(str, parts)])) * scale
+    h = _key(tag)
+    for p in parts: h = _mix(h ^ _key(str(p)))
+    u = (h >> 11) * (1.0 / (1 << 53))
+    return (u*2.0 - 1.0) * scale
+
+# Epsilon in blocco (N,) per le chiavi "tag|id|suffix..."
+def eps_vec(tag, ids, scale, *suffix):
+    if _mode == "blake2b":
+        tail = "".join(f"|{s}" for s in suffix)
+        return np.array([_compat(f"{tag}|{i}{tail}") for i in ids], dtype=np.float64) * scale
+    h = _mix_np(np.uint64(_key(tag)) ^ _keys(ids))
+    for s in suffix: h = _mix_np(h ^ np.uint64(_key(str(s))))
+    return _to_eps(h, scale)
+
+# Epsilon in blocco (N,M) per le chiavi "tag|ids[n]|others[m]"
+def eps_pairs(tag, ids, others, scale):
+    if _mode == "blake2b":
+        return np.array([[_compat(f"{tag}|{i}|{o}") for o in others] for i in ids],
+                        dtype=np.float64).reshape(len(ids), len(others)) * scale
+    h = _mix_np(np.uint64(_key(tag)) ^ _keys(ids))
+    h = _mix_np(h[:,None] ^ _keys(others)[None,:])
+    return _to_eps(h, scale)
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+   profiling.py — trace per stadio (wall, CPU, picco memoria, conteggi) attivabile con --profile
+"""
+
+import atexit
+import json
+import sys
+import threading
+import time
+from pathlib import Path
+
+tracemalloc = None          # cProfile/tracemalloc importati solo da enable(): avvio invariato senza --profile
+
+_enabled = False
+_memory = False
+_records = []
+_stack = []                 # stadi aperti nel thread principale (per i picchi annidati)
+_lock = threading.Lock()
+_path = None
+_cprof_stage, _cprof = None, None
+_started = None
+
+# Stadio disattivato: nessun costo oltre la chiamata
+class _NullStage:
+    def __enter__(self): return self
+    def __exit__(self, *exc): return False
+    def add(self, **counts): pass
+
+_NULL = _NullStage()
+
+# Stadio misurato. Memoria (tracemalloc) solo nel thread principale: il picco è globale,
+# quindi il padre eredita i picchi dei figli prima di ogni reset.
+class _Stage:
+    def __init__(self, name, tags, memory):
+        self.name, self.tags, self.counts = name, tags, {}
+        self.main = threading.current_thread() is threading.main_thread()
+        self.mem = memory and _memory and self.main
+        self.child_peak = 0
+
+    def add(self, **counts):
+        for k, v in counts.items():
+            self.counts[k] = self.counts.get(k, 0) + v
+
+    def __enter__(self):
+        if self.mem:
+            cur, peak = tracemalloc.get_traced_memory()
+            if _stack: _stack[-1].child_peak = max(_stack[-1].child_peak, peak)
+            tracemalloc.reset_peak()
+            self.m0 = cur
+        if self.main: _stack.append(self)
+        self.parent = _stack[-2].name if self.main and len(_stack) > 1 else None
+        self.c0 = time.process_time() if self.main else time.thread_time()
+        self.t0 = time.perf_counter()
+        if _cprof is not None and self.name == _cprof_stage:
+            _cprof.enable()
+        return self
+
+    def __exit__(self, *exc):
+        wall = time.perf_counter() - self.t0
+        cpu = (time.process_time() if self.main else time.thread_time()) - self.c0
+        if _cprof is not None and self.name == _cprof_stage:
+            _cprof.disable()
+        rec = {"stage": self.name, **self.tags, "wall_s": round(wall, 6), "cpu_s": round(cpu, 6)}
+        if self.main:
+            _stack.pop()
+        if self.mem:
+            peak = max(tracemalloc.get_traced_memory()[1], self.child_peak)
+            rec["peak_kb"] = round((peak - self.m0) / 1024, 1)
+            if _stack: _stack[-1].child_peak = max(_stack[-1].child_peak, peak)
+            tracemalloc.reset_peak()
+        if self.parent: rec["parent"] = self.parent
+        rec.update(self.counts)
+        with _lock:
+            _records.append(rec)
+        return False
+
+# with stage("rating", segment="flat") as s: ...; s.add(cells=R.size)
+def stage(name, memory=True, **tags):
+    return _Stage(name, tags, memory) if _enabled else _NULL
+
+def enabled():
+    return _enabled
+
+# Voci registrate in un processo figlio (fork) da riportare nel padre: mark() prima, since(m) dopo
+def mark():
+    return len(_records)
+
+def since(m):
+    return _records[m:]
+
+def merge(records):
+    with _lock:
+        _records.extend(records)
+
+def enable(path, profile_stage=None, memory=True):
+    global _enabled, _memory, _path, _cprof_stage, _cprof, _started, tracemalloc
+    _enabled, _memory, _path = True, memory, Path(path)
+    _started = time.time()
+    if memory:
+        import tracemalloc
+        if not tracemalloc.is_tracing(): tracemalloc.start()
+    if profile_stage:
+        import cProfile
+        _cprof_stage, _cprof = profile_stage, cProfile.Profile()
+    atexit.register(write)
+
+def summary(records=None):
+    out = {}
+    for r in records if records is not None else _records:
+        s = out.setdefault(r["stage"], {"calls": 0, "wall_s": 0.0, "cpu_s": 0.0})
+        s["calls"] += 1
+        s["wall_s"] = round(s["wall_s"] + r["wall_s"], 6)
+        s["cpu_s"] = round(s["cpu_s"] + r["cpu_s"], 6)
+        if "peak_kb" in r:
+            s["peak_kb_max"] = max(s.get("peak_kb_max", 0.0), r["peak_kb"])
+    return out
+
+# Trace JSON (+ dump cProfile .prof accanto, se richiesto); chiamata anche all'uscita
+def write(path=None):
+    if not _enabled:
+        return
+    path = Path(path or _path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with _lock:
+        records = list(_records)
+    doc = {"meta": {"argv": sys.argv, "python": sys.version.split()[0], "started": _started,
+                    "memory": _memory, "profile_stage": _cprof_stage},
+           "stages": records, "summary": summary(records)}
+    path.write_text(json.dumps(doc, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"📊 Profilo salvato: {path}")
+    if _cprof is not None:
+        prof = path.with_suffix(".prof")
+        _cprof.dump_stats(str(prof))
+        print(f"📊 cProfile ({_cprof_stage}): {prof}  →  python -m pstats {prof}")
+
+# --profile [PATH] [--profile-stage NOME] dagli argomenti grezzi (script senza argparse)
+def from_argv(argv, default_path):
+    if "--profile" not in argv:
+        return False
+    i = argv.index("--profile")
+    path = argv[i+1] if i+1 < len(argv) and not argv[i+1].startswith("--") else default_path
+    st = argv[argv.index("--profile-stage")+1] if "--profile-stage" in argv[:-1] else None
+    enable(path, st)
+    return True
@@ -0,0 +1,580 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+   ranking.py — core di ranking condiviso: componenti dei voti calcolate una volta
+   (coach come riga opzionale in testa) + aggregatori AWM-majority / MRP.
+   Gli aggregatori senza coach (AWM) vedono solo gli studenti: target di classe, prefiltro e voti
+   sono quelli di una run senza coach, quindi il ranking democratico non dipende dall'istruttore.
+"""
+
+import contextlib, heapq, io, json, math, random, sys
+import numpy as np
+from statistics import median
+from collections import defaultdict
+from pathlib import Path
+from config import CLASS_SIZE, RATINGS_DUMP, RATINGS_FORMAT, SEGMENT_WORKERS, RATING_CACHE
+from scoring import (ANCHOR_BPM, ANCHOR_DANCE, ANCHOR_VALENCE, MAX_THEORETICAL,
+                     FALLBACK_TOL, RITMO_MAP, BALLO_MAP, UMORE_MAP,
+                     favorite_owner_from_note, genre_similarity, fuzzy,
+                     genre_table, ComponentCache, awm_critical_tau, awm_relax, awm_means, top_k)
+from catalog import BpmIndex, Catalog
+from genre_ranges import FEATURE_RANGES_CSV, read_genre_ranges
+from noise import eps, eps_vec
+import profiling
+from profiling import stage
+
+# Path
+TRACKS_PATH        = Path("output/tracks_by_genre.json")
+PERSONAS_PATH      = Path("profiles/personas.json")
+INSTR_PATH         = Path("profiles/istruttore.json")
+CLASS_OUTPUT_PATH  = Path("output/ranking_class.json")
+CLASS_VOTES_PATH   = Path("output/individual_ratings.json")
+INSTR_OUTPUT_PATH  = Path("output/ranking_instructor.json")
+INSTR_VOTES_PATH   = Path("output/individual_ratings_instructor.json")
+
+# Parametri
+TOPK_EXPORT = 50
+N_PARTECIPANTI = CLASS_SIZE    # partecipanti oltre al coach (CLASS_SIZE o --participants)
+DUMP_RATINGS   = RATINGS_DUMP  # voti per partecipante nei dump individual_ratings*.json (--no-ratings)
+SEG_WORKERS    = SEGMENT_WORKERS  # processi per i segmenti (--segment-workers); 1 = in serie
+RATINGS_FMT    = RATINGS_FORMAT   # json | npz | jsonl.gz (--ratings-format)
+USE_RATING_CACHE = RATING_CACHE   # componenti persona × brano riusate tra le run (--rating-cache)
+_RATING_STORE  = None             # aperta alla prima run che la usa (una connessione per processo)
+
+# Segmenti e corridoi
+SEGMENTS = [
+    {"name":"warmup",   "len":1, "bpm_bias":-0.02, "dance_bias": 0.00, "target_bpm_shift":-6},
+    {"name":"flat",     "len":2, "bpm_bias": 0.02, "dance_bias": 0.01, "target_bpm_shift":+2},
+    {"name":"climb",    "len":2, "bpm_bias": 0.05, "dance_bias": 0.00, "target_bpm_shift":+6},
+    {"name":"sprint",   "len":2, "bpm_bias": 0.12, "dance_bias": 0.03, "target_bpm_shift":+12},
+    {"name":"cooldown", "len":1, "bpm_bias":-0.06, "dance_bias":-0.02, "target_bpm_shift":-10},
+]
+def bpm_corridor_mult_for(seg):  # ampiezza corridoio BPM per segmento
+    return {"warmup":2.3,"flat":2.2,"climb":2.0,"sprint":1.9,"cooldown":2.3}.get(seg,2.2)
+
+def segment_quota(seg):
+    total_len = sum(s["len"] for s in SEGMENTS)
+    return max(1, round(TOPK_EXPORT*seg["len"]/total_len))
+
+# AWM “a maggioranza” (paper)
+AWM_TAU        = 0.35   # soglia minima di ammissibilità
+AWM_QUORUM     = 0.60   # maggioranza qualificata
+AWM_RELAX_STEP = 0.05   # rilassamento τ se non si copre la quota
+AWM_MAX_RELAX  = 5
+
+# Pesi feature per rating
+WEIGHTS_BASE = {"genre": 0.22, "bpm": 0.40, "dance": 0.28, "valence": 0.10}
+LAMBDA_DECAY = 0.22  # decay posizionale per generi
+def pos_weights(n=10, lam=LAMBDA_DECAY): return [math.exp(-lam*i) for i in range(n)]
+POS_W = pos_weights()
+
+# Tolleranze (anchor, fallback e mappe qualitative in scoring.py)
+TOL_MULT     = {"bpm":1.35, "dance":1.25, "valence":1.2}
+GEN_TOL      = {}
+BPM_INDEX    = BpmIndex()  # imputazione BPM per macro-genere, ricostruito in run_full
+GENRE_TAB    = None        # similarità persona × genere della classe, compilata in run_full
+
+# IO / util
+def jload(p: Path):
+    return json.load(p.open("r", encoding="utf-8"))
+
+def jsave(p: Path, obj):
+    json.dump(obj, p.open("w", encoding="utf-8"), indent=2, ensure_ascii=False)
+
+# Come jsave({**head, key: dict(items)}) ma scritto voce per voce (stessi byte): il dict di tutte
+# le voci non esiste mai in memoria → numero di voci
+def jsave_items(p: Path, head, items, key="items"):
+    n = 0
+    with p.open("w", encoding="utf-8") as f:
+        f.write(json.dumps(head, indent=2, ensure_ascii=False)[:-2] + f",\n  {json.dumps(key)}: {{")
+        for k, v in items:
+            body = json.dumps(v, indent=2, ensure_ascii=False).replace("\n", "\n    ")
+            f.write(f"{',' if n else ''}\n    {json.dumps(k, ensure_ascii=False)}: {body}")
+            n += 1
+        f.write("\n  }\n}" if n else "}\n}")
+    return n
+
+def seed_from_argv(argv):
+    seed = None
+    if "--seed" in argv:
+        try:
+            seed = int(argv[argv.index("--seed")+1])
+        except Exception:
+            seed = 42
+    if seed is None:
+        random.seed()  # casuale ad ogni esecuzione
+    else:
+        random.seed(seed)
+        print(f"🔁 Seed riproducibile: {seed}")
+    return seed
+
+# --participants N / --no-ratings / --segment-workers N / --ratings-format F / --rating-cache
+# dagli argomenti grezzi (rank_*.py)
+def class_options_from_argv(argv):
+    global N_PARTECIPANTI, DUMP_RATINGS, SEG_WORKERS, RATINGS_FMT, USE_RATING_CACHE
+    if "--ratings-format" in argv[:-1]:
+        RATINGS_FMT = argv[argv.index("--ratings-format")+1]
+        if RATINGS_FMT not in ("json", "npz", "jsonl.gz"):
+            raise SystemExit(f"❌ Formato voti sconosciuto: {RATINGS_FMT} (json, npz, jsonl.gz)")
+    if "--participants" in argv[:-1]:
+        N_PARTECIPANTI = int(argv[argv.index("--participants")+1])
+    if "--segment-workers" in argv[:-1]:
+        SEG_WORKERS = int(argv[argv.index("--segment-workers")+1])
+    if "--no-ratings" in argv:
+        DUMP_RATINGS = False
+    if "--rating-cache" in argv:
+        USE_RATING_CACHE = True
+
+def rating_store():
+    global _RATING_STORE
+    if not USE_RATING_CACHE: return None
+    if _RATING_STORE is None:
+        import rating_cache
+        _RATING_STORE = rating_cache.RatingCache()
+    return _RATING_STORE
+
+# Nomi per i log: classi grandi abbreviate
+def names_label(names, limit=20):
+    if len(names) <= limit: return ", ".join(names)
+    return ", ".join(names[:limit]) + f", … (+{len(names)-limit})"
+
+def tolerances_from_ranges(ranges):
+    gen_tol = defaultdict(lambda: FALLBACK_TOL.copy())
+    def tol(mn,mx,k): return None if (mn is None or mx is None or mx<mn) else k*(mx-mn)/2.0
+    for g, r in (ranges or {}).items():
+        (bpm_min,bpm_max), (d_min,d_max), (v_min,v_max) = r["bpm"], r["danceability"], r["valence"]
+        gen_tol[g] = {
+            "bpm":   (tol(bpm_min,bpm_max,0.85) or FALLBACK_TOL["bpm"])   * TOL_MULT["bpm"],
+            "dance": (tol(d_min,d_max,0.95)    or FALLBACK_TOL["dance"]) * TOL_MULT["dance"],
+            "valence":(tol(v_min,v_max,0.90)   or FALLBACK_TOL["valence"])* TOL_MULT["valence"],
+        }
+    return gen_tol
+
+def load_genre_tolerances(csv_path: Path, ranges=None):
+    global GEN_TOL
+    if ranges is None: ranges = read_genre_ranges(csv_path)
+    GEN_TOL = tolerances_from_ranges(ranges)
+    if ranges is None:
+        print(f"⚠️  CSV non trovato: {csv_path}. Uso fallback.")
+        return
+    print(f"✅ Tolleranze caricate: {len(ranges)} righe valide (delim=',')")
+
+def segment_bias_weights(seg):
+    w = WEIGHTS_BASE.copy()
+    w["bpm"]   = max(0.0, min(0.60, w["bpm"]   + seg.get("bpm_bias",0.0)))
+    w["dance"] = max(0.0, min(0.60, w["dance"] + seg.get("dance_bias",0.0)))
+    s = sum(w.values())
+    for k in w: w[k] /= s
+    return w
+
+def class_targets(personas):
+    bpm_t = median([RITMO_MAP.get(p.get("ritmo_preferito"),105) for p in personas])
+    d_t   = median([BALLO_MAP.get(p.get("ballabilità"),0.5) for p in personas])
+    v_t   = median([UMORE_MAP.get(p.get("umore_musicale"),0.5) for p in personas])
+    return bpm_t,d_t,v_t
+
+#  Voto 0–1 per persona x brano, normalizzato e con micro-epsilon.
+#  Riferimento scalare: il runner usa la versione vettoriale scoring.rating_matrix.
+def component_score_for(persona, track, tol, seg_w, seg_targets):
+    # Override per brano preferito
+    fav_owner = favorite_owner_from_note(track.get("note"))
+    if fav_owner and persona.get("nome") and persona["nome"].strip() == fav_owner:
+        return 1.0
+
+    g   = track.get("genre")
+    bpm = track.get("bpm")
+    if bpm is None: bpm = BPM_INDEX.impute(g)
+    d   = track.get("danceability")
+    v   = track.get("valence")
+
+    gsc = genre_similarity(g, persona.get("generi_preferiti",[]), persona.get("nome","?")) if g else 0.5
+    bsc = fuzzy(bpm, RITMO_MAP.get(persona.get("ritmo_preferito")), tol["bpm"])
+    dsc = fuzzy(d,   BALLO_MAP.get(persona.get("ballabilità")),     tol["dance"])   if d is not None else 0.5
+    vsc = fuzzy(v,   UMORE_MAP.get(persona.get("umore_musicale")),  tol["valence"]) if v is not None else 0.5
+
+    base = seg_w["genre"]*gsc + seg_w["bpm"]*bsc + seg_w["dance"]*dsc + seg_w["valence"]*vsc
+    cbpm, cd, cv = seg_targets
+    base += (ANCHOR_BPM    * fuzzy(bpm, cbpm, tol["bpm"])
+           + ANCHOR_DANCE  * fuzzy(d,   cd,   tol["dance"])
+           + ANCHOR_VALENCE* fuzzy(v,   cv,   tol["valence"]))
+
+    base += eps("t", track.get('id','?'), persona.get('nome','?'), scale=0.004)
+    norm = base / MAX_THEORETICAL
+    return max(0.0, min(1.0, norm))
+
+# AWM-majority (riferimento scalare; il runner usa scoring.awm_critical_tau)
+def awm_majority_pass(ratings, tau=AWM_TAU, quorum=AWM_QUORUM):
+    if not ratings: return False
+    ok = sum(1 for v in ratings if v >= tau)
+    return (ok / len(ratings)) >= quorum
+
+def awm_mean(ratings, tau=AWM_TAU):
+    vals = [v for v in ratings if v >= tau]
+    return (sum(vals)/len(vals)) if vals else 0.0
+
+# Componenti persona × brano della run: catalogo deduplicato per id, BPM imputati una volta
+# (mancanti o 0, come `bpm or impute`); tracks = Catalog o lista di record
+def build_components(tracks, personas):
+    cat = tracks if isinstance(tracks, Catalog) else Catalog.from_records(tracks)
+    rows=[]; seen=set()
+    for j, (tid, c) in enumerate(zip(cat.ids, cat.genre.tolist())):
+        if c < 0 or tid in seen: continue
+        rows.append(j); seen.add(tid)
+    uniq = cat.take(rows)
+    bpm = uniq.bpm.copy()
+    for j in np.flatnonzero(np.isnan(bpm) | (bpm == 0)).tolist():
+        bpm[j] = BPM_INDEX.impute(uniq.genre_name(j))
+    return ComponentCache(personas, uniq, bpm, GEN_TOL, GENRE_TAB, store=rating_store())
+
+def segment_targets(seg, cls_targets):
+    base_bpm, base_d, base_v = cls_targets
+    return (base_bpm + seg.get("target_bpm_shift",0), base_d, base_v)
+
+# Prefiltro strutturale: corridoio BPM del segmento (niente preferenze hard) → colonne di cc
+def prefilter(seg, cc, seg_targets):
+    return np.flatnonzero(np.abs(cc.bpm-seg_targets[0]) <= bpm_corridor_mult_for(seg["name"])*cc.tol_bpm)
+
+# Tensore voti di un segmento: prefiltro corridoio BPM + matrice (coach?) + studenti × brani.
+# `rows` = persone di cc da votare (STUDENTS: vista senza coach sulle componenti della classe intera)
+STUDENTS = slice(1, None)
+
+def score_segment(seg, tracks, personas, cls_targets, coach=False, cc=None, rows=slice(None)):
+    seg_targets = segment_targets(seg, cls_targets)
+    seg_w = segment_bias_weights(seg)
+    if cc is None: cc = build_components(tracks, personas)
+
+    with stage("prefilter", segment=seg["name"]) as s:
+        cols = prefilter(seg, cc, seg_targets)
+        s.add(tracks=len(cc.tracks), kept=len(cols))
+
+    with stage("rating", segment=seg["name"]) as s:
+        R = cc.ratings(cols, seg_w, seg_targets, rows)
+        s.add(cells=int(R.size))
+    return {"seg": seg, "ids": [cc.tracks.ids[j] for j in cols], "R": R,
+            "coach": coach, "coach_name": personas[0].get("nome","COACH") if coach else None}
+
+def _students(st):
+    R = st["R"]
+    return R[1:] if st["coach"] and len(R)>1 else R
+
+# Aggregatori: punteggio di ordinamento sulle colonne idonee (filtro AWM già applicato)
+def awm_scores(st, cols, tau, ids):
+    return awm_means(_students(st)[:,cols], tau) + eps_vec("awm", ids, 0.001)
+
+def mrp_scores(st, cols, tau, ids):
+    coach = st["R"][0,cols] if len(st["R"]) else np.zeros(len(cols))
+    return coach + eps_vec("mrp", ids, 0.001, st["coach_name"])
+
+# nome → (funzione punteggio, chiave nel dump, servono i voti del coach?)
+AGGREGATORS = {
+    "awm": {"score": awm_scores, "key": "group_score", "with_coach": False},
+    "mrp": {"score": mrp_scores, "key": "coach_score", "with_coach": True},
+}
+
+# Filtro AWM-majority + ordinamento con l'aggregatore scelto → (dump del segmento, ranking)
+def aggregate_segment(st, name, rng=random):
+    agg = AGGREGATORS[name]
+    seg, R, ids = st["seg"], st["R"], st["ids"]
+    if agg["with_coach"] and not st["coach"]:
+        raise ValueError(f"L'aggregatore {name} richiede il coach nella prima riga")
+    rows = R if agg["with_coach"] or not st["coach"] else R[1:]
+
+    scores_by_track={tid:{} for tid in ids}
+
+    quota=segment_quota(seg)
+    # Tau critico (solo studenti) una volta per brano, poi rilassamento e idonei con un sort
+    with stage("awm_relax", segment=seg["name"], mode=name) as s:
+        crit=awm_critical_tau(_students(st), AWM_QUORUM)
+        tau, relax, ok = awm_relax(crit, quota, AWM_TAU, AWM_RELAX_STEP, AWM_MAX_RELAX)
+        cols=np.flatnonzero(ok)
+        elig=[ids[j] for j in cols]
+        s.add(tracks=len(ids), eligible=len(elig), relax=relax)
+
+    with stage("selection", segment=seg["name"], mode=name) as s:
+        sc = agg["score"](st, cols, tau, elig)
+        # Varietà minima: permutazione seedata del segmento come chiave secondaria dei pareggi
+        tie = np.random.default_rng(rng.getrandbits(64)).permutation(len(elig))
+        picked = [(elig[i], float(sc[i])) for i in top_k(sc, quota, tie)]
+        s.add(pool=len(elig), picked=len(picked))
+    print(f"[{seg['name']}] {name.upper()} quota={quota} inclusi={len(picked)} awm_tau_finale={tau:.2f} relax={relax}")
+
+    ranked={tid:round(sc,6) for (tid,sc) in picked}
+
+    with stage("dump_build", segment=seg["name"], mode=name) as s:
+        # Somme per colonna (voti degli idonei arrotondati come nel dump) → medie della run in O(brani)
+        tot, first = rows.sum(axis=0), (rows[0].copy() if len(rows) else np.zeros(len(ids)))
+        if len(rows):
+            for k in range(0, len(cols), 4096):  # a blocchi: niente copia persone × idonei intera
+                c = cols[k:k+4096]
+                tot[c] = np.round(rows[:,c], 4).sum(axis=0)
+            first[cols] = np.round(first[cols], 4)
+        for tid, v, f in zip(ids, tot.tolist(), first.tolist()):
+            scores_by_track[tid]["votes"] = (v, len(rows), f)
+        # Voti per partecipante solo se richiesti nel dump: blocco float64 per il JSON, float32 per i colonnari
+        block = None
+        if RATINGS_FMT != "json":
+            score = np.full(len(ids), np.nan, dtype=np.float32); score[cols] = sc
+            block = {"ids": ids, "score": score,
+                     "ratings": np.ascontiguousarray(rows.T, dtype=np.float32) if DUMP_RATINGS else None}
+        elif DUMP_RATINGS:   # JSON: brani × persone, idonei arrotondati in NumPy; liste solo in scrittura
+            RT = rows.T.copy()
+            RT[cols] = np.round(RT[cols], 4)
+            block = {"ids": ids, "ratings": RT}
+        for tid, v in zip(elig, sc.tolist()):
+            d=scores_by_track[tid]
+            d[agg["key"]]=round(v,4)
+            d["final_score"]=round(v,4)
+        s.add(tracks=len(ids), cells=int(rows.size) if DUMP_RATINGS else 0)
+    return scores_by_track, ranked, block
+
+# Segment runner: componenti condivise, più aggregatori. Con il coach, quelli che non lo usano
+# votano sulla vista solo studenti (student_targets = class_targets(personas[1:])); se i target
+# coincidono la vista è la stessa matrice senza la prima riga e non si ricalcola
+def run_segment(seg, tracks, personas, cls_targets, aggregators=("awm",), coach=False, cc=None, rng=random,
+                student_targets=None):
+    if cc is None: cc = build_components(tracks, personas)
+    split = coach and len(personas) > 1
+    if split and student_targets is None: student_targets = class_targets(personas[1:])
+    views, out = {}, {}
+    for name in aggregators:
+        full = not split or AGGREGATORS[name]["with_coach"] or student_targets == cls_targets
+        if full not in views:
+            views[full] = score_segment(seg, tracks, personas, cls_targets, coach=coach, cc=cc) if full else \
+                          score_segment(seg, tracks, personas[1:], student_targets, cc=cc, rows=STUDENTS)
+        out[name] = aggregate_segment(views[full], name, rng)
+    return out
+
+# Segmenti in parallelo: stato della run passato una volta per worker (con fork senza copie),
+# ogni segmento col proprio flusso RNG; log e voci di profilo tornano al padre in ordine di segmento
+_SEG_RUN = {}
+
+def _init_segments(state, options):
+    global DUMP_RATINGS, RATINGS_FMT
+    _SEG_RUN.update(state); DUMP_RATINGS, RATINGS_FMT = options
+
+def _segment_job(i):
+    a, m, log = _SEG_RUN, profiling.mark(), io.StringIO()
+    with contextlib.redirect_stdout(log):
+        out = run_segment(SEGMENTS[i], a["tracks"], a["personas"], a["cls_t"], a["aggregators"],
+                          a["coach"], a["cc"], random.Random(a["seeds"][i]), a["stu_t"])
+    return out, log.getvalue(), profiling.since(m)
+
+def run_segments(state, workers=None):
+    workers = SEG_WORKERS if workers is None else workers
+    if workers <= 1:
+        return [run_segment(seg, state["tracks"], state["personas"], state["cls_t"], state["aggregators"],
+                            state["coach"], state["cc"], random.Random(seed), state["stu_t"])
+                for seg, seed in zip(SEGMENTS, state["seeds"])]
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    fork = "fork" in multiprocessing.get_all_start_methods()
+    with ProcessPoolExecutor(max_workers=min(workers, len(SEGMENTS)),
+                             mp_context=multiprocessing.get_context("fork") if fork else None,
+                             initializer=_init_segments, initargs=(state, (DUMP_RATINGS, RATINGS_FMT))) as ex:
+        outs = []
+        for out, log, recs in ex.map(_segment_job, range(len(SEGMENTS))):
+            print(log, end="")
+            profiling.merge(recs)
+            outs.append(out)
+    return outs
+
+# Quote per segmento → lista unica, dedup sul migliore
+def blend(seg_ranked):
+    final_items=[]
+    for seg in SEGMENTS:
+        final_items.extend(list(seg_ranked[seg["name"]].items())[:segment_quota(seg)])
+    agg={}
+    for tid,sc in final_items: agg[tid]=max(agg.get(tid,0.0), sc)
+    return agg, {tid for tid,_ in final_items}
+
+# (somma voti, n. votanti, voto della prima riga) dei selezionati, segmento per segmento
+def _selected_votes(seg_scores, final_ids):
+    for _, sd in seg_scores.items():
+        for tid in final_ids:
+            if tid in sd and sd[tid]["votes"][1]: yield sd[tid]["votes"]
+
+# Pipeline: personas[0] è il coach se coach=True; tolerances già caricate (opzionale)
+# ALL_TRACKS = Catalog (batch: convertito una volta) o lista di record del JSON
+def run_full(ALL_TRACKS, personas, aggregators=("awm",), coach=False, tolerances=None):
+    cat = ALL_TRACKS if isinstance(ALL_TRACKS, Catalog) else Catalog.from_records(ALL_TRACKS)
+    tracks = cat.known()                # solo generi della mappa macro-generi
+    global BPM_INDEX, GENRE_TAB, GEN_TOL
+    BPM_INDEX = BpmIndex(cat)           # una volta per caricamento catalogo
+    GENRE_TAB = genre_table(personas)   # una volta per classe
+    with stage("tolerance_load") as s:
+        if tolerances is None: load_genre_tolerances(FEATURE_RANGES_CSV)
+        else: GEN_TOL = tolerances
+        s.add(genres=len(GEN_TOL))
+    cls_t = class_targets(personas)
+    stu_t = class_targets(personas[1:]) if coach and len(personas) > 1 else None   # vista AWM
+    with stage("components") as s:
+        cc = build_components(tracks, personas)  # componenti riusate da tutti i segmenti
+        s.add(personas=len(personas), tracks=len(cc.tracks))
+        if rating_store() is not None:
+            st = rating_store().stats
+            s.add(pairs_reused=st.get("pairs_reused", 0), pairs_computed=st.get("pairs_computed", 0))
+            print(f"♻️  Cache voti: {st.get('personas_cached', 0)}/{len(personas)} persone in cache, "
+                  f"coppie riusate {st.get('pairs_reused', 0)}, calcolate {st.get('pairs_computed', 0)}")
+
+    # Un flusso RNG per segmento dal seed globale: stesso risultato in serie e in parallelo
+    seeds = [random.getrandbits(64) for _ in SEGMENTS]
+    state = {"tracks": tracks, "personas": personas, "cls_t": cls_t, "stu_t": stu_t, "aggregators": aggregators,
+             "coach": coach, "cc": cc, "seeds": seeds}
+    seg_scores = {n:{} for n in aggregators}; seg_ranked = {n:{} for n in aggregators}
+    seg_votes = {n:{} for n in aggregators}
+    for seg, out in zip(SEGMENTS, run_segments(state)):
+        for n,(s,r,b) in out.items():
+            seg_scores[n][seg["name"]]=s; seg_ranked[n][seg["name"]]=r
+            if b is not None: seg_votes[n][seg["name"]]=b
+
+    results={}
+    for n in aggregators:
+        agg, final_ids = blend(seg_ranked[n])
+        vs = list(_selected_votes(seg_scores[n], final_ids))
+        tot, cnt = math.fsum(v for v,_,_ in vs), sum(k for _,k,_ in vs)
+        if AGGREGATORS[n]["with_coach"]:
+            # Medie sui selezionati: tutti, solo studenti, solo coach
+            coach_t = math.fsum(f for _,_,f in vs)
+            means = (tot/cnt if cnt else 0.0, (tot-coach_t)/(cnt-len(vs)) if cnt > len(vs) else 0.0,
+                     coach_t/len(vs) if vs else 0.0)
+        else:
+            means = tot/cnt if cnt else 0.0
+        results[n] = {"agg": agg, "means": means, "seg_ranked": seg_ranked[n], "seg_scores": seg_scores[n],
+                      "seg_votes": seg_votes[n], "catalog": cc.tracks, "bpm": cc.bpm}
+    return results
+
+# Export: stringhe del brano lette dal catalogo della run solo qui
+def _track_out(cat, tid, score):
+    j = cat.row(tid)
+    if j is None: return None
+    return {"title":cat.titles[j],"artist":cat.artists[j],"genre":cat.genre_name(j),"score":round(score,3)}
+
+def format_list(agg, cat):
+    out=[]
+    for tid,score in heapq.nlargest(TOPK_EXPORT, agg.items(), key=lambda x:x[1]):
+        item=_track_out(cat, tid, score)
+        if item: out.append(item)
+    return out
+
+def format_segments(seg_ranked, cat):
+    segments_out={}
+    for seg in SEGMENTS:
+        items=[]
+        for tid, sc in list(seg_ranked[seg["name"]].items())[:segment_quota(seg)]:
+            item=_track_out(cat, tid, sc)
+            if item: items.append(item)
+        segments_out[seg["name"]]=items
+    return segments_out
+
+def parameters():
+    return {
+        "SEGMENTS": SEGMENTS,
+        "AWM_TAU": AWM_TAU, "AWM_QUORUM": AWM_QUORUM,
+        "AWM_RELAX_STEP": AWM_RELAX_STEP, "AWM_MAX_RELAX": AWM_MAX_RELAX,
+        "WEIGHTS_BASE": WEIGHTS_BASE, "LAMBDA_DECAY": LAMBDA_DECAY,
+        "ANCHORS": {
+            "BPM": ANCHOR_BPM, "DANCE": ANCHOR_DANCE, "VALENCE": ANCHOR_VALENCE,
+            "MAX_THEORETICAL": MAX_THEORETICAL
+        }
+    }
+
+# Voci del dump JSON: ogni segmento sovrascrive la voce dello stesso brano, che resta nella posizione
+# del primo segmento. Voti per partecipante solo con DUMP_RATINGS (altrimenti solo punteggi), dai
+# blocchi di seg_votes: una lista per voce, creata mentre la si scrive
+def vote_items(participants, seg_scores, seg_votes, cat, score_key):
+    names, last = set(participants), {}
+    for sname, sdict in seg_scores.items():
+        for j, (tid, s) in enumerate(sdict.items()):
+            fav_owner = cat.owner(cat.row(tid))
+            if fav_owner and fav_owner in names:
+                key = f"{tid} ## BRANO PREFERITO DI {fav_owner}"
+            else:
+                key = tid
+            last[key] = (sname, j, s)
+    for key, (sname, j, s) in last.items():
+        block = seg_votes.get(sname)
+        item = {"ratings": block["ratings"][j].tolist() if block else []} if DUMP_RATINGS else {}
+        item[score_key] = s.get(score_key)
+        item["final_score"] = s.get("final_score")
+        yield key, item
+
+# Dump dei voti: JSON leggibile o colonnare (ratings_export.py) → (percorso scritto, voci)
+def export_votes(path, mode, participants, res, score_key, extra=None):
+    if RATINGS_FMT == "json":
+        n = jsave_items(path, {"mode": mode, **(extra or {}), "participants": participants},
+                        vote_items(participants, res["seg_scores"], res["seg_votes"], res["catalog"], score_key))
+        return path, n
+    import ratings_export
+    return ratings_export.write(RATINGS_FMT, path, mode, participants, res["seg_votes"], res["catalog"],
+                                score_key, extra)
+
+def write_class_outputs(res, partecipanti, out_path=CLASS_OUTPUT_PATH, votes_path=CLASS_VOTES_PATH):
+    results={
+        "partecipanti": partecipanti,
+        "Metodo": "AWM-majority (filtro+ranking) — puro articolo",
+        "Segments": format_segments(res["seg_ranked"], res["catalog"]),
+        "TopK_globale_AWM": format_list(res["agg"], res["catalog"]),
+        "Voto_medio_generale": round(res["means"],3),
+        "Parametri": parameters(),
+    }
+    with stage("json_export", mode="awm", format=RATINGS_FMT) as s:
+        jsave(out_path, results)
+        votes_path, n = export_votes(votes_path, "group-AWM-majority", partecipanti, res, "group_score")
+        s.add(files=2, items=n)
+
+    print("\n🎼 Playlist generata (AWM-majority — puro articolo).")
+    print(f"   • Voto medio CLASSE (tutti): {results['Voto_medio_generale']}")
+    print(f"✅ Salvato: {out_path}")
+    print(f"✅ Salvato: {votes_path}")
+    return results
+
+def write_instructor_outputs(res, partecipanti, out_path=INSTR_OUTPUT_PATH, votes_path=INSTR_VOTES_PATH):
+    mean_global, mean_students, mean_coach = res["means"]
+    results={
+        "partecipanti": partecipanti,
+        "Metodo": "MRP (ordinamento) + AWM-majority (filtro)",
+        "Segments": format_segments(res["seg_ranked"], res["catalog"]),
+        "TopK_globale_MRP": format_list(res["agg"], res["catalog"]),
+        "Voto_medio_generale": round(mean_global,3),
+        "Voto_medio_partecipanti": round(mean_students,3),
+        "Voto_medio_istruttore": round(mean_coach,3),
+        "Parametri": parameters(),
+    }
+    with stage("json_export", mode="mrp", format=RATINGS_FMT) as s:
+        jsave(out_path, results)
+        votes_path, n = export_votes(votes_path, "coach-MRP + AWM-majority", partecipanti, res,
+                                     "coach_score", {"coach_index": 0})
+        s.add(files=2, items=n)
+
+    print("\n🎼 Playlist generata (MRP + AWM-majority).")
+    print(f"   • Voto medio CLASSE (tutti):        {results['Voto_medio_generale']}")
+    print(f"   • Voto medio PARTECIPANTI (solo):   {results['Voto_medio_partecipanti']}")
+    print(f"   • Voto medio ISTRUTTORE (solo):     {results['Voto_medio_istruttore']}")
+    print(f"✅ Salvato: {out_path}")
+    print(f"✅ Salvato: {votes_path}")
+    return results
+
+# Classe: coach + N partecipanti casuali (escluso il coach)
+def sample_class(instructor, all_personas, n=None):
+    if n is None: n = N_PARTECIPANTI
+    others=[p for p in all_personas if p.get("nome") != instructor.get("nome")]
+    if len(others) < n: raise SystemExit(f"⚠️ Servono almeno {n} partecipanti oltre al coach.")
+    return [dict(instructor,_is_instructor=True)] + [dict(p,_is_instructor=False) for p in random.sample(others,n)]
+
+# Main: un solo tensore per entrambe le modalità (classe AWM + istruttore MRP)
+if __name__ == "__main__":
+    seed_from_argv(sys.argv)
+    class_options_from_argv(sys.argv)
+    profiling.from_argv(sys.argv, "output/profile_ranking.json")
+
+    INSTRUCTOR   = jload(INSTR_PATH)
+    ALL_PERSONAS = jload(PERSONAS_PATH)
+    ALL_TRACKS   = jload(TRACKS_PATH)
+
+    personas=sample_class(INSTRUCTOR, ALL_PERSONAS)
+    partecipanti=[p.get("nome",f"p{i}") for i,p in enumerate(personas)]
+    print(f"\n👤 Coach: {partecipanti[0]}  |  Partecipanti ({len(partecipanti)-1}): {names_label(partecipanti[1:])}")
+
+    res = run_full(ALL_TRACKS, personas, aggregators=("awm","mrp"), coach=True)
+    write_class_outputs(res["awm"], partecipanti[1:])
+    write_instructor_outputs(res["mrp"], partecipanti)
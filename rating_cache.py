@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+   rating_cache.py — cache persistente (SQLite) delle componenti voto persona × brano tra le run
+
+   Per ogni persona (hash del contenuto del profilo) e set di parametri (hash di tolleranze, mappe
+   qualitative, fallback e modalità noise) si conserva la riga float64 di bpm/dance/valence ed
+   epsilon su un insieme di brani (chiave = id + genere + feature usate, BPM imputati compresi).
+   Una run ricalcola solo le coppie nuove: rider nuovo o profilo modificato → riga intera,
+   brani nuovi o con feature cambiate → solo quelle colonne. Similarità di genere e preferiti
+   restano calcolati a ogni run (lookup in tabella); pesi dei segmenti e anchor si applicano dopo,
+   in ComponentCache.ratings(), e non entrano nelle chiavi. Eviction LRU per riga entro max_mb.
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+import noise
+from config import RATING_CACHE_MB
+from scoring import FALLBACK_TOL, RITMO_MAP, BALLO_MAP, UMORE_MAP
+
+CACHE_PATH = Path("output/rating_cache.sqlite")
+VERSION = 1     # da incrementare se cambia il calcolo delle componenti in scoring.py
+
+# Metadati LRU separati dai blob: aggiornare last_used non riscrive la riga da T×32 byte
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS track_sets (
+    set_key TEXT PRIMARY KEY,
+    keys    BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS rows (
+    persona_key TEXT NOT NULL,
+    param_key   TEXT NOT NULL,
+    set_key     TEXT NOT NULL,
+    nbytes      INTEGER NOT NULL,
+    last_used   REAL NOT NULL,
+    PRIMARY KEY (persona_key, param_key)
+);
+CREATE TABLE IF NOT EXISTS row_data (
+    persona_key TEXT NOT NULL,
+    param_key   TEXT NOT NULL,
+    data        BLOB NOT NULL,
+    PRIMARY KEY (persona_key, param_key)
+);
+CREATE INDEX IF NOT EXISTS rows_lru ON rows (last_used);
+"""
+
+def _digest(s, size=16):
+    return hashlib.blake2b(s.encode("utf-8"), digest_size=size).hexdigest()
+
+# Contenuto del profilo (campi interni "_..." esclusi: il ruolo non cambia le componenti)
+def persona_key(p):
+    return _digest(json.dumps({k: v for k, v in p.items() if not k.startswith("_")},
+                              sort_keys=True, ensure_ascii=False, default=str))
+
+def param_key(gen_tol):
+    return _digest(json.dumps({"v": VERSION, "tol": gen_tol, "fallback": FALLBACK_TOL, "ritmo": RITMO_MAP,
+                               "ballo": BALLO_MAP, "umore": UMORE_MAP, "noise": noise.get_mode()},
+                              sort_keys=True, ensure_ascii=False))
+
+# Chiave uint64 per brano: id + genere + feature effettivamente usate (BPM già imputati)
+def track_keys(cc):
+    cat = cc.tracks
+    return np.array([int(_digest(f"{tid}|{cat.genre_name(j)}|{b!r}|{d!r}|{v!r}", 8), 16)
+                     for j, (tid, b, d, v) in enumerate(zip(cat.ids, cc.bpm.tolist(), cc.dance.tolist(),
+                                                           cc.valence.tolist()))], dtype=np.uint64)
+
+# Righe persona × (bpm, dance, valence, epsilon) su un set di brani; una connessione per processo
+class RatingCache:
+    def __init__(self, path=CACHE_PATH, max_mb=RATING_CACHE_MB, clock=time.time):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.path), timeout=60, check_same_thread=False)
+        self._db.executescript(_SCHEMA)
+        self.stats = {}
+
+    def close(self):
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _load(self, pkeys, param):
+        out = {}
+        with self._lock:
+            for i in range(0, len(pkeys), 500):  # limite parametri SQLite
+                chunk = pkeys[i:i+500]
+                q = (f"SELECT r.persona_key, r.set_key, d.data FROM rows r JOIN row_data d "
+                     f"USING (persona_key, param_key) WHERE r.param_key=? "
+                     f"AND r.persona_key IN ({','.join('?'*len(chunk))})")
+                for pk, sk, data in self._db.execute(q, [param, *chunk]):
+                    out[pk] = (sk, data)
+        return out
+
+    def _set(self, set_key):
+        with self._lock:
+            row = self._db.execute("SELECT keys FROM track_sets WHERE set_key=?", (set_key,)).fetchone()
+        return None if row is None else np.frombuffer(row[0], dtype=np.uint64)
+
+    # Riempie cc.C (bpm, dance, valence) e cc.noise: righe/colonne in cache copiate, il resto via cc.fill()
+    def fill(self, cc, personas, gen_tol):
+        P, T = cc.n_personas, len(cc)
+        pkeys = [persona_key(p) for p in personas]
+        param = param_key(gen_tol)
+        tkeys = track_keys(cc)
+        cur_set = hashlib.blake2b(tkeys.tobytes(), digest_size=16).hexdigest()
+        found = self._load(sorted(set(pkeys)), param)
+
+        # persone raggruppate per set di brani in cache (None = nessuna riga)
+        groups = {}
+        for i, pk in enumerate(pkeys):
+            groups.setdefault(found[pk][0] if pk in found else None, []).append(i)
+        reused = computed = 0
+        dirty = set()
+        for sk, rows in groups.items():
+            if sk is None:
+                cc.fill(rows, None); computed += len(rows) * T; dirty.update(rows)
+                continue
+            keys = tkeys if sk == cur_set else self._set(sk)
+            if keys is None:
+                cc.fill(rows, None); computed += len(rows) * T; dirty.update(rows)
+                continue
+            if sk == cur_set:
+                hit, pos = np.arange(T), np.arange(T)
+            else:
+                order = np.argsort(keys, kind="stable")
+                at = np.minimum(np.searchsorted(keys, tkeys, sorter=order), len(keys) - 1)
+                ok = keys[order[at]] == tkeys if len(keys) else np.zeros(T, dtype=bool)
+                hit, pos = np.flatnonzero(ok), order[at[ok]]
+            for i in rows:   # una riga alla volta: niente copia (n, 4, T) intera
+                a = np.frombuffer(found[pkeys[i]][1], dtype=np.float64).reshape(4, len(keys))
+                if sk == cur_set:
+                    cc.C[0][i], cc.C[1][i], cc.C[2][i], cc.noise[i] = a
+                else:
+                    for c in range(3): cc.C[c][i, hit] = a[c, pos]
+                    cc.noise[i, hit] = a[3, pos]
+            for i in rows: found.pop(pkeys[i], None)
+            reused += len(rows) * len(hit)
+            if len(hit) < T:
+                cc.fill(rows, np.setdiff1d(np.arange(T), hit))
+                computed += len(rows) * (T - len(hit))
+            if sk != cur_set: dirty.update(rows)
+
+        self._store(pkeys, param, cur_set, tkeys, cc, dirty)
+        self.stats = {"personas": P, "personas_cached": P - len(groups.get(None, ())),
+                      "pairs_reused": reused, "pairs_computed": computed}
+        return self.stats
+
+    # Righe nuove o aggiornate sul set corrente + last_used delle altre, poi eviction LRU
+    def _store(self, pkeys, param, cur_set, tkeys, cc, dirty):
+        now = self._clock()
+        first = {}
+        for i in sorted(dirty): first.setdefault(pkeys[i], i)
+        nbytes = 4 * len(cc) * 8
+        def blobs():   # generati uno alla volta durante l'insert
+            for pk, i in first.items():
+                yield pk, param, np.stack([cc.C[0][i], cc.C[1][i], cc.C[2][i], cc.noise[i]]).tobytes()
+        touched = [(now, pk, param) for pk in set(pkeys) - set(first)]
+        with self._lock, self._db:
+            if first:
+                self._db.execute("INSERT OR IGNORE INTO track_sets VALUES (?,?)", (cur_set, tkeys.tobytes()))
+                self._db.executemany("INSERT OR REPLACE INTO rows VALUES (?,?,?,?,?)",
+                                     [(pk, param, cur_set, nbytes, now) for pk in first])
+                self._db.executemany("INSERT OR REPLACE INTO row_data VALUES (?,?,?)", blobs())
+            self._db.executemany("UPDATE rows SET last_used=? WHERE persona_key=? AND param_key=?", touched)
+        self.evict()
+
+    # Righe meno usate di recente fuori finché il totale sta in max_bytes; set di brani orfani rimossi
+    def evict(self):
+        with self._lock, self._db:
+            total = self._db.execute("SELECT COALESCE(SUM(nbytes), 0) FROM rows").fetchone()[0]
+            if total > self.max_bytes:
+                drop = []
+                for pk, pa, n in self._db.execute("SELECT persona_key, param_key, nbytes FROM rows "
+                                                  "ORDER BY last_used").fetchall():
+                    if total <= self.max_bytes: break
+                    drop.append((pk, pa)); total -= n
+                self._db.executemany("DELETE FROM rows WHERE persona_key=? AND param_key=?", drop)
+                self._db.executemany("DELETE FROM row_data WHERE persona_key=? AND param_key=?", drop)
+            self._db.execute("DELETE FROM track_sets WHERE set_key NOT IN (SELECT DISTINCT set_key FROM rows)")
+        return total
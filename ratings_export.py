@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+   ratings_export.py — dump colonnare dei voti per partecipante (npz o JSON Lines gzip)
+
+   Una riga per coppia (segmento, brano): a differenza di individual_ratings*.json, dove ogni segmento
+   sovrascrive la stessa chiave, qui restano tutti i segmenti. Colonne npz:
+     participants (P,)  segments (S,)  segment (N,) int8  track_id (N,)  favorite_of (N,) ("" = nessuno)
+     ratings (N, P) float32 (assente con --no-ratings)  <chiave punteggio> (N,) float32, NaN = non idoneo
+   Lettura: d = np.load("output/individual_ratings.npz"); d["ratings"][d["segment"] == 0]
+"""
+
+import gzip
+import json
+import zipfile
+from pathlib import Path
+
+import numpy as np
+
+FORMATS = {"npz": ".npz", "jsonl.gz": ".jsonl.gz"}
+
+# output/individual_ratings.json → output/individual_ratings.npz
+def path_for(path, fmt):
+    path = Path(path)
+    return path.with_name(path.name.split(".")[0] + FORMATS[fmt])
+
+# Proprietario del preferito dalla colonna intera del catalogo (solo se partecipa alla lezione)
+def _favorites(cat, ids, names):
+    out = []
+    for tid in ids:
+        owner = cat.owner(cat.row(tid))
+        out.append(owner if owner and owner in names else "")
+    return out
+
+# Colonna .npy scritta a pezzi nel membro dello zip: header con la forma totale, poi i blocchi
+def _npy(zf, name, chunks, dtype, shape):
+    dtype = np.dtype(dtype)
+    with zf.open(name + ".npy", "w", force_zip64=True) as f:
+        np.lib.format.write_array_header_2_0(
+            f, {"descr": np.lib.format.dtype_to_descr(dtype), "fortran_order": False, "shape": shape})
+        for c in chunks:
+            f.write(np.ascontiguousarray(c, dtype=dtype).tobytes())
+
+def write_npz(path, mode, participants, seg_votes, cat, score_key, extra=None):
+    names, segs = set(participants), list(seg_votes)
+    blocks = [seg_votes[s] for s in segs]
+    n = sum(len(b["ids"]) for b in blocks)
+    with_ratings = all(b["ratings"] is not None for b in blocks)
+    favs = [_favorites(cat, b["ids"], names) for s, b in zip(segs, blocks)]
+    id_t = f"<U{max([1] + [len(t) for b in blocks for t in b['ids']])}"
+    fav_t = f"<U{max([1] + [len(o) for f in favs for o in f])}"
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_STORED) as zf:   # float32 si comprime poco: niente deflate
+        for k, v in {"mode": mode, **(extra or {})}.items():
+            _npy(zf, k, [np.array(v)], np.array(v).dtype, ())
+        _npy(zf, "participants", [np.array(participants, dtype=str)],
+             f"<U{max([1] + [len(p) for p in participants])}", (len(participants),))
+        _npy(zf, "segments", [np.array(segs, dtype=str)], f"<U{max(len(s) for s in segs)}", (len(segs),))
+        _npy(zf, "segment", (np.full(len(b["ids"]), i) for i, b in enumerate(blocks)), np.int8, (n,))
+        _npy(zf, "track_id", (np.array(b["ids"], dtype=id_t) for b in blocks), id_t, (n,))
+        _npy(zf, "favorite_of", (np.array(f, dtype=fav_t) for f in favs), fav_t, (n,))
+        _npy(zf, score_key, (b["score"] for b in blocks), np.float32, (n,))
+        if with_ratings:
+            _npy(zf, "ratings", (b["ratings"] for b in blocks), np.float32, (n, len(participants)))
+    return n
+
+def write_jsonl(path, mode, participants, seg_votes, cat, score_key, extra=None):
+    names, n = set(participants), 0
+    with gzip.open(path, "wt", encoding="utf-8", compresslevel=6) as f:
+        f.write(json.dumps({"mode": mode, **(extra or {}), "participants": participants,
+                            "segments": list(seg_votes)}, ensure_ascii=False) + "\n")
+        for sname, b in seg_votes.items():
+            # Arrotondati a blocco, convertiti in float Python una riga alla volta: mai l'intero blocco in liste
+            rat = None if b["ratings"] is None else np.round(b["ratings"].astype(np.float64), 4)
+            score = np.round(b["score"].astype(np.float64), 4).tolist()
+            for j, (tid, fav) in enumerate(zip(b["ids"], _favorites(cat, b["ids"], names))):
+                rec = {"segment": sname, "id": tid}
+                if fav: rec["favorite_of"] = fav
+                rec[score_key] = None if score[j] != score[j] else score[j]
+                if rat is not None: rec["ratings"] = rat[j].tolist()
+                f.write(json.dumps(rec, ensure_ascii=False, separators=(",", ":")) + "\n")
+                n += 1
+    return n
+
+WRITERS = {"npz": write_npz, "jsonl.gz": write_jsonl}
+
+# File temporaneo + rename, come save_catalog → (percorso scritto, righe)
+def write(fmt, path, mode, participants, seg_votes, cat, score_key, extra=None):
+    path = path_for(path, fmt)
+    tmp = path.with_name(path.name + ".tmp")
+    n = WRITERS[fmt](tmp, mode, participants, seg_votes, cat, score_key, extra)
+    tmp.replace(path)
+    return path, n
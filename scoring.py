@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+   scoring.py — motore di scoring vettoriale (persona × brano)
+"""
+
+import math
+import numpy as np
+from config import GENRE_TO_MACROGENRE
+from noise import eps, eps_pairs
+
+# Anchor di coerenza + normalizzazione
+ANCHOR_BPM      = 0.06
+ANCHOR_DANCE    = 0.03
+ANCHOR_VALENCE  = 0.015
+MAX_THEORETICAL = 1.0 + ANCHOR_BPM + ANCHOR_DANCE + ANCHOR_VALENCE  # = 1.105
+
+# Tolleranze di fallback (genere assente dal CSV)
+FALLBACK_TOL = {"bpm":18.0, "dance":0.18, "valence":0.18}
+
+# Mappe qualitative (target per persona)
+RITMO_MAP  = {"lento":70, "moderato":105, "veloce":130}
+BALLO_MAP  = {"scarso":0.2, "medio":0.5, "alto":0.8}
+UMORE_MAP  = {"introspettivo":0.2, "equilibrato":0.5, "solare":0.8}
+
+def get_macros(g):
+    v = GENRE_TO_MACROGENRE.get(g, [])
+    return [v] if isinstance(v,str) else list(v)
+
+# Estrae il nome dalla nota '## BRANO PREFERITO DI <Nome>'.
+def favorite_owner_from_note(note: str) -> str | None:
+    if not isinstance(note, str): return None
+    prefix = "## BRANO PREFERITO DI "
+    if note.startswith(prefix):
+        name = note[len(prefix):].strip()
+        return name if name else None
+    return None
+
+# Generi internati: id intero per genere, macro-generi come bitmask (match = un AND)
+GENRES      = list(GENRE_TO_MACROGENRE)
+GENRE_ID    = {g:i for i,g in enumerate(GENRES)}
+MACRO_BIT   = {m:1<<k for k,m in enumerate(sorted({m for g in GENRES for m in get_macros(g)}))}
+GENRE_MASK  = [sum(MACRO_BIT[m] for m in set(get_macros(g))) for g in GENRES]
+_GENRE_FOLD = {g.casefold():g for g in GENRES}
+
+# "Indie elettronico " / "hip-hop" → nome canonico del genere (se noto)
+def normalize_genre(g):
+    s = " ".join(str(g).split())
+    return _GENRE_FOLD.get(s.casefold(), s)
+
+def intern_genres(genres):
+    return [GENRE_ID.get(normalize_genre(g), -1) for g in genres]
+
+def _similarity(gid, track_genre, pids, persona_name):
+    # exact match
+    for i, x in enumerate(pids):
+        if x == gid:
+            sim = 0.88 + 0.10*math.exp(-0.42*i)
+            sim += eps("g", track_genre, persona_name, i, scale=0.004)
+            return max(0.0, min(1.0, sim))
+    # macro match (best over positions)
+    tmask = GENRE_MASK[gid]
+    best = 0.0
+    for i, x in enumerate(pids):
+        if x >= 0 and tmask & GENRE_MASK[x]:
+            cand = 0.52 + 0.36*math.exp(-0.38*i)
+            if cand > best: best = cand
+    if best > 0.0:
+        best += eps("gm", track_genre, persona_name, scale=0.0035)
+        return max(0.0, min(1.0, best))
+    # nessuna affinità: base bassa con un filo di varietà
+    base = 0.28 + eps("g0", track_genre, persona_name, scale=0.005)
+    return max(0.0, min(1.0, base))
+
+# Similarità continue
+def genre_similarity(track_genre, persona_genres, persona_name):
+    gid = GENRE_ID.get(track_genre)
+    if gid is None:  # genere fuori mappa: nessuna affinità
+        return max(0.0, min(1.0, 0.28 + eps("g0", track_genre, persona_name, scale=0.005)))
+    return _similarity(gid, track_genre, intern_genres(persona_genres[:10]), persona_name)
+
+# Tabella similarità (persona × genere id), compilata una volta per classe
+def genre_table(personas):
+    tab = np.empty((len(personas), len(GENRES)))
+    for r, p in enumerate(personas):
+        pids = intern_genres(p.get("generi_preferiti",[])[:10])
+        name = p.get("nome","?")
+        for gid, g in enumerate(GENRES):
+            tab[r,gid] = _similarity(gid, g, pids, name)
+    return tab
+
+# Valutazione continua (gaussiana)
+def fuzzy(value, target, tol):
+    if value is None or target is None or tol is None:
+        return 0.5
+    # d normalizzato rispetto a (1.6*tol) → curva morbida
+    d = abs(value - target) / max(1e-6, 1.6*tol)
+    score = 0.30 + 0.65*math.exp(-(d*d))
+    return max(0.0, min(1.0, score))
+
+# Come fuzzy() ma su array in broadcast: NaN (valore/target mancante) → 0.5
+def fuzzy_np(value, target, tol):
+    d = np.abs(value - target) / np.maximum(1e-6, 1.6*tol)
+    score = np.clip(0.30 + 0.65*np.exp(-(d*d)), 0.0, 1.0)
+    return np.where(np.isnan(score), 0.5, score)
+
+def _num(x):
+    return float(x) if isinstance(x,(int,float)) else np.nan
+
+# Target per persona come colonne (P,1); NaN se il campo qualitativo manca
+def persona_targets(personas):
+    bpm = np.array([_num(RITMO_MAP.get(p.get("ritmo_preferito"))) for p in personas])
+    d   = np.array([_num(BALLO_MAP.get(p.get("ballabilità")))     for p in personas])
+    v   = np.array([_num(UMORE_MAP.get(p.get("umore_musicale")))  for p in personas])
+    return bpm[:,None], d[:,None], v[:,None]
+
+# Feature e tolleranze per brano come righe (1,T) da un Catalog; bpm già imputati dal chiamante.
+# Tolleranze: una riga per codice genere, l'ultima (indice -1 = genere assente) è FALLBACK_TOL.
+def track_arrays(cat, bpm, gen_tol):
+    tols  = [gen_tol.get(g, FALLBACK_TOL) for g in cat.genres] + [FALLBACK_TOL]
+    tab   = np.array([[x["bpm"], x["dance"], x["valence"]] for x in tols])[cat.genre]
+    bpm   = np.array([_num(b) for b in bpm])
+    return (bpm[None,:], cat.danceability[None,:], cat.valence[None,:],
+            tab[None,:,0], tab[None,:,1], tab[None,:,2])
+
+# Similarità di genere: tabella della classe (P, generi+1), ultima colonna 0.5 per i generi fuori mappa,
+# e colonna della tabella per ogni brano (codici del Catalog = GENRE_ID per i generi della mappa)
+def genre_lookup(gtab, cat):
+    tab = np.concatenate([gtab, np.full((len(gtab), 1), 0.5)], axis=1)
+    idx = cat.genre.astype(np.int64)
+    return tab, np.where((idx >= 0) & (idx < len(GENRES)), idx, len(GENRES))
+
+# Micro-epsilon per coppia (brano, persona), generati in blocco (vedi noise.py)
+def rating_noise(personas, cat):
+    return _pair_noise([p.get("nome","?") for p in personas], cat.ids)
+
+def _pair_noise(names, tids):
+    return eps_pairs("t", ["?" if t is None else t for t in tids], names, 0.004).T
+
+# Brani preferiti (voto forzato a 1.0 per il proprietario): codice proprietario di ogni persona,
+# confrontato in ratings() con la colonna fav del catalogo
+def owner_codes(personas, cat):
+    code  = {o: i for i, o in enumerate(cat.owners)}
+    names = [p["nome"].strip() if p.get("nome") else None for p in personas]
+    return np.array([code.get(n, -1) for n in names], dtype=np.int32)
+
+# Componenti indipendenti dal segmento (bpm, dance, valence) ed epsilon: calcolati una volta per run
+# su tutto il catalogo; ogni segmento fa solo la pesatura (combinazione delle 4 componenti) più i
+# propri anchor. Genere e preferiti sono lookup: tabella persona × genere e codici proprietario,
+# espansi solo sulle colonne del segmento, quindi in memoria restano 4 piani P×T invece di 5 + maschera.
+# store (opzionale, vedi rating_cache.py): fornisce dalle run precedenti le coppie già calcolate
+# di bpm/dance/valence ed epsilon e chiama fill() solo sulle coppie mancanti.
+class ComponentCache:
+    def __init__(self, personas, tracks, bpm, gen_tol, gtab=None, store=None):
+        if not hasattr(tracks, "genres"):
+            from catalog import Catalog         # import locale: catalog importa scoring
+            tracks = Catalog.from_records(tracks)
+        self.tracks = tracks
+        self.n_personas = len(personas)
+        self.names = [p.get("nome","?") for p in personas]
+        self.targets = persona_targets(personas)
+        t_bpm, t_d, t_v, tol_b, tol_d, tol_v = track_arrays(self.tracks, bpm, gen_tol)
+        self.bpm, self.dance, self.valence = t_bpm[0], t_d[0], t_v[0]
+        self.tol_bpm, self.tol_dance, self.tol_valence = tol_b[0], tol_d[0], tol_v[0]
+        P, T = len(personas), len(self.tracks)
+        self.C = np.empty((3, P, T))  # componenti contigue: bpm, dance, valence
+        self.noise = np.zeros((P, T))
+        self.gtab, self.gcode = genre_lookup(genre_table(personas) if gtab is None else gtab, self.tracks)
+        self.owner = owner_codes(personas, self.tracks)
+        if P and T:
+            if store is None: self.fill()
+            else: store.fill(self, personas, gen_tol)
+
+    # bpm/dance/valence ed epsilon per persone `rows` × brani `cols` (None = tutte/i)
+    def fill(self, rows=None, cols=None):
+        pr = slice(None) if rows is None else np.asarray(rows, dtype=np.int64)
+        tc = slice(None) if cols is None else np.asarray(cols, dtype=np.int64)
+        at = (pr, tc) if rows is None or cols is None else np.ix_(pr, tc)
+        p_bpm, p_d, p_v = (x[pr] for x in self.targets)
+        self.C[0][at] = fuzzy_np(self.bpm[tc][None,:],     p_bpm, self.tol_bpm[tc][None,:])
+        self.C[1][at] = fuzzy_np(self.dance[tc][None,:],   p_d,   self.tol_dance[tc][None,:])
+        self.C[2][at] = fuzzy_np(self.valence[tc][None,:], p_v,   self.tol_valence[tc][None,:])
+        names = self.names if rows is None else [self.names[i] for i in pr.tolist()]
+        tids  = self.tracks.ids if cols is None else [self.tracks.ids[j] for j in tc.tolist()]
+        self.noise[at] = _pair_noise(names, tids)
+
+    def __len__(self):
+        return len(self.tracks)
+
+    # Matrice voti 0–1 (persona × brano) per le colonne `cols` di un segmento;
+    # `rows` (slice) limita le persone, es. solo studenti con il coach in prima riga
+    def ratings(self, cols, seg_w, seg_targets, rows=slice(None)):
+        cols = np.asarray(cols, dtype=np.int64)
+        n = len(range(self.n_personas)[rows])
+        if not n or not len(cols):
+            return np.zeros((n, len(cols)))
+        C = self.C[:, rows][:, :, cols]
+        G = self.gtab[rows][:, self.gcode[cols]]
+        b, d, v = self.bpm[cols], self.dance[cols], self.valence[cols]
+        tb, td, tv = self.tol_bpm[cols], self.tol_dance[cols], self.tol_valence[cols]
+
+        base = seg_w["genre"]*G + seg_w["bpm"]*C[0] + seg_w["dance"]*C[1] + seg_w["valence"]*C[2]
+        cbpm, cd, cv = seg_targets
+        base = base + (ANCHOR_BPM    * fuzzy_np(b, cbpm, tb)
+                     + ANCHOR_DANCE  * fuzzy_np(d, cd,   td)
+                     + ANCHOR_VALENCE* fuzzy_np(v, cv,   tv))[None,:]
+
+        base = base + self.noise[rows][:, cols]
+        norm = np.clip(base / MAX_THEORETICAL, 0.0, 1.0)
+        own = self.owner[rows]
+        norm[(self.tracks.fav[cols][None,:] == own[:,None]) & (own[:,None] >= 0)] = 1.0
+        return norm
+
+#  Matrice voti 0–1 (persona × brano) di un segmento in un unico passaggio vettoriale.
+def rating_matrix(personas, tracks, bpm, gen_tol, seg_w, seg_targets, gtab=None):
+    cc = ComponentCache(personas, tracks, bpm, gen_tol, gtab)
+    return cc.ratings(np.arange(len(cc)), seg_w, seg_targets)
+
+# AWM-majority in un passaggio. Un brano passa a soglia tau se almeno k voti sono >= tau,
+# quindi il suo "tau critico" è il k-esimo voto più alto (statistica d'ordine per colonna).
+def _quorum_count(n, quorum):
+    for k in range(n+1):
+        if k/n >= quorum: return k
+    return n+1
+
+def awm_critical_tau(R, quorum):
+    n, T = R.shape
+    if n == 0:
+        return np.full(T, -np.inf)
+    k = _quorum_count(n, quorum)
+    if k == 0:   return np.full(T, np.inf)
+    if k > n:    return np.full(T, -np.inf)
+    return -np.partition(-R, k-1, axis=0)[k-1]
+
+# Rilassamento di tau sui tau critici (stessa sequenza di passi del loop): al più
+# max_relax+1 conteggi lineari, nessun ordinamento
+def awm_relax(crit, quota, tau, step, max_relax):
+    def n_ok(t): return int(np.count_nonzero(crit >= t))
+    relax = 0
+    while n_ok(tau) < quota and relax < max_relax:
+        relax += 1; tau = max(0.0, tau-step)
+    return tau, relax, crit >= tau
+
+# Top-k per punteggio decrescente, pareggi risolti dalla chiave secondaria crescente (valori distinti):
+# partizione + ordinamento dei soli candidati, O(n + k log k). Indici nell'ordine finale.
+def top_k(scores, k, tie):
+    n = len(scores)
+    if k <= 0 or n == 0:
+        return np.empty(0, dtype=np.intp)
+    cand = np.flatnonzero(scores >= np.partition(scores, n-k)[n-k]) if k < n else np.arange(n)
+    return cand[np.lexsort((tie[cand], -scores[cand]))[:k]]
+
+# AWM-mean per colonna: media dei voti >= tau (0 se nessuno)
+def awm_means(R, tau):
+    ok  = R >= tau
+    cnt = ok.sum(axis=0)
+    tot = np.where(ok, R, 0.0).sum(axis=0)
+    return np.where(cnt > 0, tot / np.maximum(cnt, 1), 0.0)
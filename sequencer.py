@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+   sequencer.py — sessione a tempo: ogni segmento riempito al suo budget di minuti, in ordine di BPM morbido
+
+   Dopo run_full: per ogni segmento i brani idonei (filtro AWM già passato) con il punteggio
+   dell'aggregatore (AWM o MRP) sono i candidati. Il budget del segmento è la sua quota `len` dei minuti
+   della lezione. Obiettivo da massimizzare:
+       Σ punteggio × minuti del brano  −  BPM_PENALTY × Σ |ΔBPM| tra brani consecutivi
+   (il primo brano paga il salto dall'ultimo del segmento precedente), con la durata totale entro
+   budget ± SLACK_S. Il punteggio pesato sui minuti non premia i brani corti solo perché più numerosi.
+   Ricerca a fascio (beam search) vettoriale: a ogni passo tutti gli stati × tutti i candidati in un
+   colpo, tenuti i BEAM migliori (deduplicati per insieme di brani + ultimo). Un brano compare una volta.
+"""
+
+import time
+
+import numpy as np
+
+import ranking
+from config import SESSION_MINUTES
+from profiling import stage
+
+DEFAULT_DURATION_MS = 210_000   # brani senza duration_ms (preferiti, cataloghi vecchi)
+BPM_PENALTY = 0.01              # punteggio·minuto perso per ogni BPM di salto
+SLACK_S     = 30.0              # tolleranza sul budget del segmento (secondi)
+BEAM        = 64
+POOL        = 300               # candidati per segmento (i migliori per punteggio)
+
+# Budget in secondi per segmento, in proporzione a `len` come le quote del ranking
+def segment_budgets(minutes=SESSION_MINUTES, segments=None):
+    segments = segments or ranking.SEGMENTS
+    total = sum(s["len"] for s in segments)
+    return {s["name"]: minutes * 60.0 * s["len"] / total for s in segments}
+
+# Ordine migliore di un sottoinsieme dei candidati → (indici in ordine, valore, durata s)
+def beam_sequence(score, bpm, dur, budget, prev_bpm=None, penalty=BPM_PENALTY, slack=SLACK_S, beam=BEAM):
+    M = len(score)
+    if not M:
+        return [], 0.0, 0.0
+    gain = score * dur / 60.0
+    rate = float(score.max()) / 60.0   # stima ottimista del valore per secondo ancora libero
+    val, tot = np.zeros(1), np.zeros(1)
+    last = np.full(1, np.nan if prev_bpm is None else float(prev_bpm))
+    used = np.zeros((1, M), dtype=bool)
+    paths = [()]
+    best = None   # stato migliore: chiave (sotto budget?, secondi mancanti, -valore) minima
+    def consider(i):
+        miss = max(0.0, budget - slack - tot[i])
+        key = (miss > 0, miss, -val[i])
+        nonlocal best
+        if best is None or key < best[0]: best = (key, paths[i], val[i], tot[i])
+    while True:
+        for i in range(len(paths)): consider(i)
+        jump = np.abs(last[:, None] - bpm[None, :])
+        cand = val[:, None] + gain[None, :] - penalty * np.where(np.isnan(jump), 0.0, jump)
+        new_tot = tot[:, None] + dur[None, :]
+        ok = ~used & (new_tot <= budget + slack)
+        flat = np.flatnonzero(ok)
+        if not len(flat):
+            break
+        # Stati parziali confrontati a pari durata: valore + tempo mancante × rate (come in A*)
+        prio = (cand + np.maximum(budget - new_tot, 0.0) * rate).ravel()[flat]
+        top = flat[np.argsort(-prio, kind="stable")[:4*beam]]
+        keep, seen = [], set()
+        for f in top.tolist():
+            b, k = divmod(f, M)
+            key = (frozenset(paths[b]) | {k}, k)
+            if key in seen: continue
+            seen.add(key); keep.append((b, k))
+            if len(keep) == beam: break
+        bs = np.array([b for b, _ in keep]); ks = np.array([k for _, k in keep])
+        val = cand[bs, ks]; tot = tot[bs] + dur[ks]; last = bpm[ks]
+        used = used[bs].copy(); used[np.arange(len(ks)), ks] = True
+        paths = [paths[b] + (k,) for b, k in keep]
+    return list(best[1]), float(best[2]), float(best[3])
+
+# Sessione da un risultato di run_full (res["awm"] o res["mrp"]): segmenti in ordine, brani unici
+def sequence_session(res, minutes=SESSION_MINUTES, segments=None):
+    t0 = time.perf_counter()
+    segments = segments or ranking.SEGMENTS
+    cat, cbpm = res["catalog"], res["bpm"]
+    budgets = segment_budgets(minutes, segments)
+    taken, prev_bpm, out, jumps, clock = set(), None, {}, 0.0, 0.0
+    for seg in segments:
+        sdict = res["seg_scores"].get(seg["name"], {})
+        elig = [(tid, d["final_score"]) for tid, d in sdict.items() if "final_score" in d and tid not in taken]
+        sc = np.array([s for _, s in elig], dtype=np.float64)
+        if len(elig) > POOL:
+            sel = np.sort(np.argpartition(-sc, POOL)[:POOL])
+            elig, sc = [elig[i] for i in sel.tolist()], sc[sel]
+        rows = [cat.row(tid) for tid, _ in elig]
+        bpm = cbpm[rows] if rows else np.zeros(0)
+        dur = cat.duration_ms[rows] / 1000.0 if rows else np.zeros(0)
+        dur = np.where(np.isnan(dur) | (dur <= 0), DEFAULT_DURATION_MS / 1000.0, dur)
+        order, value, total = beam_sequence(sc, bpm, dur, budgets[seg["name"]], prev_bpm)
+        tracks = []
+        for k in order:
+            j = rows[k]
+            tracks.append({"title": cat.titles[j], "artist": cat.artists[j], "genre": cat.genre_name(j),
+                           "bpm": round(float(bpm[k]), 1), "duration_s": round(float(dur[k]), 1),
+                           "start_s": round(clock, 1), "score": round(float(sc[k]), 3)})
+            if prev_bpm is not None: jumps += abs(float(bpm[k]) - prev_bpm)
+            prev_bpm, clock = float(bpm[k]), clock + float(dur[k])
+            taken.add(elig[k][0])
+        out[seg["name"]] = {"budget_s": round(budgets[seg["name"]], 1), "duration_s": round(total, 1),
+                            "candidates": len(elig), "value": round(value, 4), "tracks": tracks}
+    ms = (time.perf_counter() - t0) * 1000
+    n = sum(len(s["tracks"]) for s in out.values())
+    total = sum(s["duration_s"] for s in out.values())
+    print(f"🧩 Sessione {minutes:g} min: {n} brani, {total/60:.1f} min, salti BPM totali {jumps:.0f} ({ms:.1f} ms)")
+    return {"minutes": minutes, "duration_s": round(total, 1), "bpm_jumps": round(jumps, 1),
+            "parameters": {"BPM_PENALTY": BPM_PENALTY, "SLACK_S": SLACK_S, "BEAM": BEAM, "POOL": POOL,
+                           "DEFAULT_DURATION_MS": DEFAULT_DURATION_MS},
+            "segments": out}
+
+def write_session(res, path, minutes=SESSION_MINUTES):
+    with stage("sequencing", minutes=minutes) as s:
+        session = sequence_session(res, minutes)
+        s.add(tracks=sum(len(x["tracks"]) for x in session["segments"].values()))
+    ranking.jsave(path, session)
+    print(f"✅ Salvato: {path}")
+    return session
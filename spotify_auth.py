@@ -1,9 +1,10 @@
 # spotify_auth.py
-import spotipy
-from spotipy.oauth2 import SpotifyOAuth, SpotifyClientCredentials
 from config import CLIENT_ID, CLIENT_SECRET, REDIRECT_URI, SCOPE
 
+# spotipy importato solo quando serve un client
 def get_spotify_user():
+    import spotipy
+    from spotipy.oauth2 import SpotifyOAuth
     return spotipy.Spotify(auth_manager=SpotifyOAuth(
         client_id=CLIENT_ID,
         client_secret=CLIENT_SECRET,
@@ -15,6 +16,8 @@ def get_spotify_user():
 
 
 def get_spotify_public():
+    import spotipy
+    from spotipy.oauth2 import SpotifyClientCredentials
     return spotipy.Spotify(auth_manager=SpotifyClientCredentials(
         client_id=CLIENT_ID,
         client_secret=CLIENT_SECRET
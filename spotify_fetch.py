@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+   spotify_fetch.py — chiamate Spotify concorrenti con rate limit condiviso
+"""
+
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from config import FETCH_CONCURRENCY, FETCH_RATE, FETCH_RETRIES
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+BACKOFF_BASE = 0.5   # secondi, raddoppia a ogni tentativo
+BACKOFF_CAP  = 30.0
+
+# RNG privato per il jitter: non consuma lo stato di `random` (shuffle/feature restano riproducibili)
+_JITTER = random.Random()
+
+# Token bucket condiviso tra i worker: `rate` richieste/s, raffiche fino a `burst`.
+# pause() (Retry-After di un 429) ferma tutti i worker, non solo quello che l'ha ricevuto.
+class TokenBucket:
+    def __init__(self, rate=FETCH_RATE, burst=None, clock=time.monotonic, sleep=time.sleep):
+        self.rate = float(rate)
+        self.capacity = float(burst or max(1.0, self.rate))
+        self._clock, self._sleep = clock, sleep
+        self._tokens = self.capacity
+        self._last = clock()
+        self._until = 0.0
+        self._lock = threading.Lock()
+
+    def pause(self, seconds):
+        with self._lock:
+            self._until = max(self._until, self._clock() + seconds)
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = self._clock()
+                wait = self._until - now
+                if wait <= 0:
+                    self._tokens = min(self.capacity, self._tokens + (now - self._last)*self.rate)
+                    self._last = now
+                    if self._tokens >= 1.0:
+                        self._tokens -= 1.0
+                        return
+                    wait = (1.0 - self._tokens) / self.rate
+            self._sleep(wait)
+
+# Bucket unico del processo: playlist (extract_tracks) e audio-features (features.py) condividono
+# lo stesso rate limit e lo stesso Retry-After
+_SHARED = None
+_SHARED_LOCK = threading.Lock()
+
+def shared_bucket():
+    global _SHARED
+    with _SHARED_LOCK:
+        if _SHARED is None: _SHARED = TokenBucket()
+        return _SHARED
+
+# Secondi indicati da Retry-After (SpotifyException.headers), None se assente
+def retry_after(exc):
+    headers = getattr(exc, "headers", None) or {}
+    val = headers.get("Retry-After") or headers.get("retry-after")
+    try:
+        return max(0.0, float(val))
+    except (TypeError, ValueError):
+        return None
+
+def is_retryable(exc):
+    status = getattr(exc, "http_status", None)
+    if status is not None:
+        return status in RETRY_STATUS
+    return isinstance(exc, OSError)  # errori di rete (requests.RequestException è un OSError)
+
+# Esegue fn() passando dal bucket; 429 → attende Retry-After, altrimenti backoff esponenziale con jitter
+def call_with_retry(fn, bucket, retries=FETCH_RETRIES, sleep=time.sleep, rng=_JITTER):
+    for attempt in range(retries + 1):
+        bucket.acquire()
+        try:
+            return fn()
+        except Exception as e:
+            if attempt >= retries or not is_retryable(e):
+                raise
+            wait = retry_after(e)
+            if wait is not None:
+                bucket.pause(wait + rng.uniform(0, BACKOFF_BASE))
+            else:
+                sleep(rng.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2**attempt)))
+
+# fetch(key, call) per ogni chiave, in parallelo; call(fn) esegue una singola richiesta
+# (bucket + retry), così le chiamate paginate pagano il rate limit pagina per pagina.
+# Genera (key, valore, errore) nell'ordine di input, appena ogni risultato è pronto.
+# Senza `bucket` si usa quello condiviso del processo.
+def fetch_iter(fetch, keys, concurrency=FETCH_CONCURRENCY, bucket=None, retries=FETCH_RETRIES):
+    bucket = bucket or shared_bucket()
+    keys = list(keys)
+
+    def call(fn):
+        return call_with_retry(fn, bucket, retries)
+
+    def one(k):
+        try:
+            return k, fetch(k, call), None
+        except Exception as e:
+            return k, None, e
+
+    if concurrency <= 1 or len(keys) <= 1:
+        yield from map(one, keys)
+        return
+    with ThreadPoolExecutor(max_workers=min(concurrency, len(keys))) as ex:
+        yield from ex.map(one, keys)
+
+def fetch_all(fetch, keys, concurrency=FETCH_CONCURRENCY, bucket=None, retries=FETCH_RETRIES):
+    return list(fetch_iter(fetch, keys, concurrency, bucket, retries))
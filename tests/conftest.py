@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# I moduli sono piatti nella root del repository
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
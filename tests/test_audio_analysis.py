@@ -0,0 +1,48 @@
+# Tempo su click track sintetiche: niente mezzo tempo sui brani veloci (sprint a 150–180 BPM)
+import wave
+
+import numpy as np
+import pytest
+
+import audio_analysis
+
+SR = 22050
+
+def click_track(bpm, seconds=20, accent=False, noise=0.0, seed=0):
+    rng = np.random.default_rng(seed)
+    x = np.zeros(int(SR * seconds), dtype=np.float32)
+    n = int(0.03 * SR)
+    burst = (rng.standard_normal(n) * np.exp(-np.arange(n) / (0.005 * SR))).astype(np.float32)
+    beat = 0
+    while True:
+        i = int(round(beat * 60.0 / bpm * SR))
+        if i + n >= len(x): break
+        x[i:i+n] += (1.0 if not accent or beat % 4 == 0 else 0.5) * 0.5 * burst
+        beat += 1
+    return x + noise * rng.standard_normal(len(x)).astype(np.float32)
+
+def write_wav(path, x):
+    with wave.open(str(path), "wb") as w:
+        w.setnchannels(1); w.setsampwidth(2); w.setframerate(SR)
+        w.writeframes((np.clip(x, -1, 1) * 32767).astype("<i2").tobytes())
+
+@pytest.mark.parametrize("bpm", range(80, 181, 5))
+@pytest.mark.parametrize("accent,noise", [(False, 0.0), (True, 0.05)])
+def test_click_track_tempo(tmp_path, bpm, accent, noise):
+    path = tmp_path / "click.wav"
+    write_wav(path, click_track(bpm, accent=accent, noise=noise, seed=bpm))
+    got = audio_analysis.analyze_file(path)["bpm"]
+    assert got == pytest.approx(bpm, rel=0.02)
+
+# Cache per contenuto: il secondo passaggio non rianalizza, e la chiave porta la versione dell'analisi
+def test_cache_by_content(tmp_path, monkeypatch):
+    for bpm in (100, 174):
+        write_wav(tmp_path / f"t{bpm}.wav", click_track(bpm, seconds=10))
+    files = audio_analysis.audio_files(tmp_path)
+    with audio_analysis.AudioCache(tmp_path / "cache.sqlite") as cache:
+        first = audio_analysis.analyze_files(files, cache=cache, workers=1)
+        monkeypatch.setattr(audio_analysis, "analyze_file", lambda p: pytest.fail("rianalizzato"))
+        assert audio_analysis.analyze_files(files, cache=cache, workers=1) == first
+        monkeypatch.setattr(audio_analysis, "ANALYSIS_VERSION", audio_analysis.ANALYSIS_VERSION + 1)
+        assert cache.get(cache.file_hash(files[0])) is None
+    assert first[tmp_path / "t174.wav"]["bpm"] == pytest.approx(174, rel=0.02)
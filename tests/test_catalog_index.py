@@ -0,0 +1,87 @@
+# Merge incrementale del catalogo offline: playlist finte al posto di Spotify, indice e JSON in tmp_path
+import json
+import random
+
+import pytest
+
+import extract_tracks
+from catalog_index import CatalogIndex
+from features import DumpFeatures, FeatureProvider, SyntheticFeatures
+
+RANGES = {"Pop": {"bpm": (100, 130), "danceability": (0.5, 0.9), "valence": (0.3, 0.8)}}
+
+# Playlist finte {playlist_id: [track_id]}: tutti i brani campionati, membership completa
+@pytest.fixture
+def playlists(monkeypatch):
+    content = {}
+    def fake_iter(sp, seen_ids, range_dict, cache=None, offline=False, members=None, sources=None):
+        for playlist_id, ids in content.items():
+            if members is not None: members[playlist_id] = set(ids)
+            for tid in ids:
+                if tid in seen_ids: continue
+                if sources is not None: sources[tid] = playlist_id
+                seen_ids.add(tid)
+                yield {"title": tid, "artist": "x", "genre": "Pop", "id": tid, "duration_ms": 200000}
+    monkeypatch.setattr(extract_tracks, "iter_playlist_tracks", fake_iter)
+    return content
+
+@pytest.fixture
+def refresh(tmp_path):
+    def run(provider):
+        with CatalogIndex(tmp_path / "index.sqlite") as index:
+            recs, feed = extract_tracks.refresh_catalog(None, RANGES, index, tmp_path / "tracks.json",
+                                                        favorites_path=tmp_path / "none.json", features=provider)
+        return {r["id"]: r for r in recs}, feed
+    return run
+
+def offline_provider(dump, seed):
+    return FeatureProvider([DumpFeatures(dump), SyntheticFeatures(RANGES, random.Random(seed))])
+
+# Feature sintetiche nell'indice: provvisorie, stabili tra le run, sostituite appena il dump le conosce
+def test_synthetic_features_replaced_by_real_backend(tmp_path, playlists, refresh):
+    dump = tmp_path / "audio_features.json"
+    playlists["pl1"] = ["a", "b"]
+    first, _ = refresh(offline_provider(dump, 1))
+    again, feed = refresh(offline_provider(dump, 2))
+    assert again == first and feed["updated"] == []
+
+    dump.write_text(json.dumps({"a": {"bpm": 999, "danceability": 0.1, "valence": 0.2}}), encoding="utf-8")
+    recs, feed = refresh(offline_provider(dump, 3))
+    assert (recs["a"]["bpm"], recs["a"]["danceability"], recs["a"]["valence"]) == (999, 0.1, 0.2)
+    assert recs["b"] == first["b"] and feed["updated"] == ["a"]
+    assert json.loads((tmp_path / "tracks.json").read_text(encoding="utf-8"))[0]["bpm"] == 999
+    with CatalogIndex(tmp_path / "index.sqlite") as index:
+        assert index.source("a") == "dump" and index.source("b") == "synthetic"
+
+    dump.unlink()   # feature definitive: il brano non ripassa dal provider
+    recs, feed = refresh(offline_provider(dump, 4))
+    assert recs["a"]["bpm"] == 999 and feed["updated"] == []
+
+# Brano in due playlist: uscito da una resta vivo, uscito da entrambe va in tombstone
+def test_tombstone_only_when_in_no_playlist(tmp_path, playlists, refresh):
+    provider = lambda: offline_provider(tmp_path / "missing.json", 1)
+    playlists.update(pl1=["a", "s"], pl2=["s", "b"])
+    recs, _ = refresh(provider())
+    assert set(recs) == {"a", "s", "b"}
+
+    playlists.update(pl1=["a"])
+    recs, feed = refresh(provider())
+    assert set(recs) == {"a", "s", "b"} and feed["deleted"] == []
+
+    playlists.update(pl1=["a", "c"], pl2=["b"], pl3=["s"])   # spostato in una playlist nuova
+    recs, feed = refresh(provider())
+    assert set(recs) == {"a", "s", "b", "c"} and feed["deleted"] == []
+
+    playlists.update(pl3=[])
+    recs, feed = refresh(provider())
+    assert set(recs) == {"a", "b", "c"} and feed["deleted"] == ["s"]
+
+# Playlist non letta in questa run: i suoi brani non perdono la membership
+def test_unread_playlist_keeps_tracks(tmp_path, playlists, refresh):
+    provider = lambda: offline_provider(tmp_path / "missing.json", 1)
+    playlists.update(pl1=["s"], pl2=["s"])
+    refresh(provider())
+    del playlists["pl2"]
+    playlists.update(pl1=[])
+    recs, feed = refresh(provider())
+    assert "s" in recs and feed["deleted"] == []
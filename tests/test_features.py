@@ -0,0 +1,62 @@
+# Provider delle feature offline: dump locale + client Spotify finto, niente rete
+import json
+import random
+
+import pytest
+
+import spotify_fetch
+from features import DumpFeatures, FeatureCache, FeatureProvider, SpotifyFeatures, SyntheticFeatures, with_features
+from spotify_fetch import TokenBucket
+
+RANGES = {"Pop": {"bpm": (100, 130), "danceability": (0.5, 0.9), "valence": (0.3, 0.8)}}
+
+class StandInClient:
+    def __init__(self, known):
+        self.known, self.calls = known, []
+
+    def audio_features(self, ids):
+        self.calls.append(list(ids))
+        return [None if i not in self.known else {"id": i, **self.known[i]} for i in ids]
+
+@pytest.fixture(autouse=True)
+def fast_bucket(monkeypatch):
+    monkeypatch.setattr(spotify_fetch, "_SHARED", TokenBucket(rate=1000))
+
+@pytest.fixture
+def cache(tmp_path):
+    with FeatureCache(tmp_path / "features.sqlite") as c:
+        yield c
+
+def test_batches_of_100_and_cache(cache):
+    ids = [f"t{i:03d}" for i in range(250)]
+    sp = StandInClient({i: {"tempo": 120.0, "danceability": 0.7, "valence": 0.5} for i in ids})
+    prov = FeatureProvider([SpotifyFeatures(sp)], cache)
+    out = prov.resolve([(i, "Pop") for i in ids])
+    assert len(out) == 250 and sorted(map(len, sp.calls)) == [50, 100, 100]
+    sp.calls.clear()
+    assert FeatureProvider([SpotifyFeatures(sp)], cache).resolve([(i, "Pop") for i in ids]) == out
+    assert sp.calls == []
+
+# Il ripiego sintetico non finisce in cache: alla run successiva vince il backend reale
+def test_synthetic_fallback_not_persisted(tmp_path, cache):
+    tracks = [("a", "Pop"), ("b", "Pop"), ("c", "Pop")]
+    first = FeatureProvider([DumpFeatures(tmp_path / "missing.json"), SyntheticFeatures(RANGES, random.Random(1))],
+                            cache).resolve(tracks)
+    assert set(first) == {"a", "b", "c"} and cache.get_many(["a", "b", "c"]) == {}
+
+    dump = tmp_path / "audio_features.json"
+    dump.write_text(json.dumps({"a": {"tempo": 128, "danceability": 0.8, "valence": 0.6}}), encoding="utf-8")
+    sp = StandInClient({"b": {"tempo": 174.0, "danceability": 0.6, "valence": 0.4}})
+    prov = FeatureProvider([DumpFeatures(dump), SpotifyFeatures(sp), SyntheticFeatures(RANGES, random.Random(2))],
+                           cache)
+    recs = list(with_features([{"id": t, "genre": g} for t, g in tracks], prov))
+    assert recs[0]["bpm"] == 128 and recs[1]["bpm"] == 174.0
+    assert prov.stats == {"dump": 1, "spotify": 1, "synthetic": 1}
+    assert set(cache.get_many(["a", "b", "c"])) == {"a", "b"}
+
+# Righe sintetiche scritte da versioni precedenti della cache sono ignorate
+def test_legacy_synthetic_rows_ignored(cache):
+    cache.put_many({"x": {"bpm": 111.0, "danceability": 0.5, "valence": 0.5}}, "synthetic")
+    sp = StandInClient({"x": {"tempo": 90.0, "danceability": 0.4, "valence": 0.2}})
+    assert FeatureProvider([SpotifyFeatures(sp)], cache).resolve([("x", "Pop")])["x"]["bpm"] == 90.0
+    assert cache.get_many(["x"])["x"]["bpm"] == 90.0
@@ -0,0 +1,41 @@
+# Ranking condiviso: il coach in prima riga non cambia il ranking democratico (AWM)
+import contextlib
+import io
+import random
+from pathlib import Path
+
+import pytest
+
+import ranking
+from bench_ranking import synth_catalog, synth_personas
+
+ROOT = Path(__file__).resolve().parent.parent
+
+@pytest.fixture(autouse=True)
+def repo_cwd(monkeypatch):
+    monkeypatch.chdir(ROOT)   # CSV dei range e tolleranze letti con percorsi relativi
+
+def _class_outputs(tmp, tracks, personas, coach, aggregators, seed=42):
+    random.seed(seed)
+    with contextlib.redirect_stdout(io.StringIO()):
+        res = ranking.run_full(tracks, personas, aggregators=aggregators, coach=coach)
+        names = [p["nome"] for p in personas]
+        ranking.write_class_outputs(res["awm"], names[1:] if coach else names,
+                                    tmp / "ranking_class.json", tmp / "individual_ratings.json")
+    return {p.name: p.read_bytes() for p in tmp.iterdir()}, res
+
+@pytest.mark.parametrize("segment_workers", [1, 2])
+def test_class_output_independent_of_coach(tmp_path, monkeypatch, segment_workers):
+    monkeypatch.setattr(ranking, "SEG_WORKERS", segment_workers)
+    students = synth_personas(10, seed=3)
+    coach = [dict(synth_personas(1, seed=4, prefix="Coach")[0],
+                  ritmo_preferito="veloce", ballabilità="alto", umore_musicale="solare")]
+    tracks = synth_catalog(3000, seed=5, fav_names=[p["nome"] for p in coach + students])
+    assert ranking.class_targets(students) != ranking.class_targets(coach + students)
+
+    (tmp_path / "alone").mkdir(); (tmp_path / "both").mkdir()
+    alone, _ = _class_outputs(tmp_path / "alone", tracks, students, False, ("awm",))
+    both, res = _class_outputs(tmp_path / "both", tracks, coach + students, True, ("awm", "mrp"))
+    assert both == alone
+    # MRP ordina comunque per il voto del coach
+    assert res["mrp"]["agg"] and res["mrp"]["agg"].keys() != res["awm"]["agg"].keys()
@@ -0,0 +1,109 @@
+# Fetch delle playlist contro un server locale che imita l'endpoint Spotify /playlists/{id}/items
+import json
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+import extract_tracks
+import spotify_fetch
+from spotify_fetch import TokenBucket
+
+PLAYLISTS = {"0LIRHeEM4hvTLeaMl24cN2": 250, "6ly6bwJeLhCvHQoEKOReLB": 40}
+
+class StandIn(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, throttle):
+        super().__init__(("127.0.0.1", 0), Handler)
+        self.throttle = throttle   # prime N richieste → 429 con Retry-After
+        self.hits = {"ok": 0, "429": 0}
+        self.lock = threading.Lock()
+        self.base = f"http://127.0.0.1:{self.server_address[1]}/v1/"
+
+class Handler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body, headers=()):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for k, v in headers: self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        srv = self.server
+        with srv.lock:
+            throttled = srv.throttle > 0
+            if throttled: srv.throttle -= 1
+            srv.hits["429" if throttled else "ok"] += 1
+        if throttled:
+            return self._send(429, {"error": {"status": 429, "message": "rate limited"}}, [("Retry-After", "0")])
+        url = urlparse(self.path)
+        m = re.match(r"^/v1/playlists/(\w+)/(?:items|tracks)$", url.path)
+        if not m or m.group(1) not in PLAYLISTS:
+            return self._send(404, {"error": {"status": 404, "message": "not found"}})
+        pid, total = m.group(1), PLAYLISTS[m.group(1)]
+        q = parse_qs(url.query)
+        limit, offset = int(q.get("limit", ["100"])[0]), int(q.get("offset", ["0"])[0])
+        items = [{"track": {"id": f"{pid[:6]}{i:05d}", "name": f"t{i}", "artists": [{"name": "a"}],
+                            "duration_ms": 200_000 + i}} for i in range(offset, min(total, offset + limit))]
+        nxt = f"{srv.base}playlists/{pid}/items?offset={offset+limit}&limit={limit}" if offset + limit < total else None
+        self._send(200, {"items": items, "next": nxt, "total": total})
+
+class StaticToken:
+    def get_access_token(self, as_dict=False):
+        return "token"
+
+class SpyBucket(TokenBucket):
+    def __init__(self):
+        super().__init__(rate=1000)
+        self.pauses = []
+
+    def pause(self, seconds):
+        self.pauses.append(seconds)
+        super().pause(seconds)
+
+@pytest.fixture
+def server():
+    srv = StandIn(throttle=3)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    yield srv
+    srv.shutdown()
+    srv.server_close()
+
+@pytest.fixture
+def bucket(monkeypatch):
+    spy = SpyBucket()
+    monkeypatch.setattr(spotify_fetch, "_SHARED", spy)
+    return spy
+
+# I 429 non restano dentro spotipy: arrivano a call_with_retry, che mette in pausa il bucket condiviso
+def test_429_reach_shared_bucket(server, bucket):
+    sp = extract_tracks.get_client(prefix=server.base, auth_manager=StaticToken())
+    members, out = {}, []
+    pl = {"Pop": list(PLAYLISTS)}
+    out = list(extract_tracks.iter_playlist_tracks(sp, set(), {"Pop": {}}, playlists_by_genre=pl,
+                                                   concurrency=2, members=members))
+    assert server.hits["429"] == 3
+    assert len(bucket.pauses) == 3
+    assert server.hits["ok"] == 3 + 1   # 250 brani = 3 pagine, 40 = 1 pagina
+    assert {pid: len(ids) for pid, ids in members.items()} == PLAYLISTS
+    assert len(out) == 2 * extract_tracks.PER_PLAYLIST
+    assert all(r["duration_ms"] >= 200_000 for r in out)
+
+def test_fetch_iter_uses_shared_bucket(bucket):
+    seen = []
+    def fetch(k, call):
+        return call(lambda: k * 2)
+    orig = bucket.acquire
+    bucket.acquire = lambda: (seen.append(1), orig())[1]
+    assert [v for _, v, _ in spotify_fetch.fetch_iter(fetch, range(5), concurrency=2)] == [0, 2, 4, 6, 8]
+    assert spotify_fetch.fetch_all(fetch, [1])[0][1] == 2
+    assert len(seen) == 6
+    assert spotify_fetch.shared_bucket() is bucket